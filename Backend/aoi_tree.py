@@ -0,0 +1,67 @@
+"""
+Hierarchical AOI (area of interest) dwell aggregation over the AST.
+
+Every named node from extract_ast_nodes covers a contiguous range of leaf
+tokens, tokens[first_token:end_token], because the leaves are collected in
+preorder. With prefix sums of per-token dwell and fixation count, any node's
+totals are a single subtraction, so annotating the whole tree is
+O(tokens + nodes + fixations * log tokens) instead of a per-node scan.
+"""
+from itertools import accumulate
+
+from fixation_finder import parse_token_span
+from spatial_index import build_token_order, token_position
+
+
+def token_prefix_sums(tokens, fixations):
+    """
+    Prefix sums of dwell_ms and fixation count in token order. Fixations are
+    placed by the span in their token_id (one bisect each), so ids from the
+    IDE's AST and from extract_tokens land on the same token.
+    """
+    order = build_token_order(tokens)
+    dwell = [0] * len(tokens)
+    count = [0] * len(tokens)
+    for f in fixations:
+        i = token_position(order, parse_token_span(f["token_id"]))
+        if i is None:
+            continue
+        dwell[i] += f["duration_ms"]
+        count[i] += 1
+    return [0] + list(accumulate(dwell)), [0] + list(accumulate(count))
+
+
+def aggregate_node_dwell(tokens, nodes, fixations):
+    """Annotate each node, in place, with total_dwell_ms and fixation_count."""
+    dwell_prefix, count_prefix = token_prefix_sums(tokens, fixations)
+    for n in nodes:
+        lo, hi = n["first_token"], n["end_token"]
+        n["total_dwell_ms"] = dwell_prefix[hi] - dwell_prefix[lo]
+        n["fixation_count"] = count_prefix[hi] - count_prefix[lo]
+    return nodes
+
+
+def nest_nodes(nodes, max_depth=None):
+    """
+    Turn the flat preorder node list into a nested tree:
+    {"type", "start", "end", "total_dwell_ms", "fixation_count", "children"}.
+    Nodes deeper than `max_depth` are left out.
+    """
+    out = [None] * len(nodes)
+    roots = []
+    for i, n in enumerate(nodes):
+        if max_depth is not None and n["depth"] > max_depth:
+            continue
+        out[i] = {
+            "type": n["type"],
+            "start": n["start"],
+            "end": n["end"],
+            "total_dwell_ms": n["total_dwell_ms"],
+            "fixation_count": n["fixation_count"],
+            "children": [],
+        }
+        if n["parent"] is None:
+            roots.append(out[i])
+        else:
+            out[n["parent"]]["children"].append(out[i])
+    return roots
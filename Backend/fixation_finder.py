@@ -25,107 +25,187 @@ import math
 import sys
 from typing import Optional
 import hashlib
+import os
 
-def parse_eye_tracking(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    gazes = []
+from spatial_index import build_line_index, lookup_token, build_screen_segments, find_segment,\
+    segment_position
+
+# IDE <location> and <level> positions are 0-based; extract_tokens' are 1-based
+IDE_LINE_OFFSET = 1
+IDE_COLUMN_OFFSET = 1
+
+class GazesOutOfOrder(Exception):
+    pass
+
+
+def iter_eye_tracking(xml_path, code_path=None):
+    """
+    Stream gazes in file order without building the whole tree: each <gaze>
+    element is dropped from its parent as soon as it has been read.
+
+    With `code_path`, gazes whose <location> is on another file are skipped and
+    token ids use make_file_id(code_path), the same scheme as extract_tokens.
+    """
+    file_id = make_file_id(code_path) if code_path else None
     last_ast = None
-    for gaze in root.findall('.//gaze'):
-        ts = gaze.get('timestamp')
-        if ts is None:
+    parents = []
+    for event, el in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            parents.append(el)
             continue
-        ts = int(ts)
-        # prefer averaged eyes if both valid
-        lx = gaze.find('./left_eye')
-        rx = gaze.find('./right_eye')
-        def read_eye(e):
-            if e is None:
-                return None, None, 0.0
-            x = e.get('gaze_point_x')
-            y = e.get('gaze_point_y')
-            valid = e.get('gaze_validity')
-            try:
-                return float(x), float(y), float(valid)
-            except:
-                return None, None, 0.0
-        lx_x, lx_y, lv = read_eye(lx)
-        rx_x, rx_y, rv = read_eye(rx)
-        x = None; y = None; validity = 0.0
-        if lv >= 1.0 and rv >= 1.0 and lx_x is not None and rx_x is not None:
-            x = (lx_x + rx_x) / 2.0
-            y = (lx_y + rx_y) / 2.0
-            validity = 1.0
-        elif lv >= 1.0 and lx_x is not None:
-            x, y, validity = lx_x, lx_y, 1.0
-        elif rv >= 1.0 and rx_x is not None:
-            x, y, validity = rx_x, rx_y, 1.0
-        else:
-            # skip invalid gaze
+        parents.pop()
+        if el.tag != "gaze":
             continue
-        # parse location (if present)
-        loc_el = gaze.find('./location')
-        location = None
-        if loc_el is not None:
-            try:
-                location = {
-                    'path': loc_el.get('path'),
-                    'line': int(loc_el.get('line')) if loc_el.get('line') is not None else None,
-                    'column': int(loc_el.get('column')) if loc_el.get('column') is not None else None,
-                    'x': int(loc_el.get('x')) if loc_el.get('x') is not None else None,
-                    'y': int(loc_el.get('y')) if loc_el.get('y') is not None else None,
-                }
-            except:
-                location = None
-        # parse AST structure (if present)
-        ast_el = gaze.find('./ast_structure')
-        ast = None
-        if ast_el is not None:
-            token = ast_el.get('token')
-            a_type = ast_el.get('type')
-            remark = ast_el.get('remark')
-            # When remark indicates same as last, levels may be absent
-            levels = []
-            for lvl in ast_el.findall('./level'):
-                levels.append({
-                    'start': lvl.get('start'),
-                    'end': lvl.get('end'),
-                    'tag': lvl.get('tag'),
-                })
-            if (
-                (not levels)
-                and remark
-                and 'Same' in remark
-                and last_ast
-                and last_ast.get('token') == token
-                and last_ast.get('type') == a_type
-            ):
-                levels = last_ast.get('levels') or []
-
-            file_id = make_file_id(xml_path)
-
-            ast = {
-                'token': token,
-                'type': a_type,
-                'levels': levels,
-                'value': token,
-            }
+        g, last_ast = read_gaze(el, xml_path, last_ast, file_id)
+        if parents:
+            parents[-1].remove(el)
+        if g is None:
+            continue
+        if code_path and g['location'] and not paths_match(g['location']['path'], code_path):
+            continue
+        yield g
 
-            token_id = make_token_id(file_id, ast)
-            if token_id:
-                ast['token_id'] = token_id
 
-            last_ast = ast
-        gazes.append({'t': ts, 'x': x, 'y': y, 'location': location, 'ast': ast})
+def parse_eye_tracking(xml_path):
+    gazes = list(iter_eye_tracking(xml_path))
     gazes.sort(key=lambda g: g['t'])
     return gazes
 
 
+def in_time_order(gazes):
+    """Pass gazes through, raising GazesOutOfOrder if a timestamp goes backwards."""
+    last_t = None
+    for g in gazes:
+        if last_t is not None and g['t'] < last_t:
+            raise GazesOutOfOrder(g['t'])
+        last_t = g['t']
+        yield g
+
+
+def consume_in_time_order(make_gazes, consume):
+    """
+    Run `consume` over a fresh gaze stream from `make_gazes()`. Recordings are
+    written in time order, so this normally streams; if a timestamp goes
+    backwards the stream is rebuilt and sorted in memory instead.
+    """
+    try:
+        return consume(in_time_order(make_gazes()))
+    except GazesOutOfOrder:
+        return consume(sorted(make_gazes(), key=lambda g: g['t']))
+
+
+def read_gaze(gaze, xml_path, last_ast, file_id=None):
+    """
+    Read one <gaze> element. Returns (gaze or None, last AST seen).
+
+    Token ids are "<file_id>:<span>" with a 1-based span. Without an explicit
+    `file_id` the file is identified by its <location path>, which is the same
+    across recordings of one project, falling back to the recording path.
+    """
+    ts = gaze.get('timestamp')
+    if ts is None:
+        return None, last_ast
+    ts = int(ts)
+    # prefer averaged eyes if both valid
+    lx = gaze.find('./left_eye')
+    rx = gaze.find('./right_eye')
+    def read_eye(e):
+        if e is None:
+            return None, None, 0.0
+        x = e.get('gaze_point_x')
+        y = e.get('gaze_point_y')
+        valid = e.get('gaze_validity')
+        try:
+            return float(x), float(y), float(valid)
+        except:
+            return None, None, 0.0
+    lx_x, lx_y, lv = read_eye(lx)
+    rx_x, rx_y, rv = read_eye(rx)
+    x = None; y = None; validity = 0.0
+    if lv >= 1.0 and rv >= 1.0 and lx_x is not None and rx_x is not None:
+        x = (lx_x + rx_x) / 2.0
+        y = (lx_y + rx_y) / 2.0
+        validity = 1.0
+    elif lv >= 1.0 and lx_x is not None:
+        x, y, validity = lx_x, lx_y, 1.0
+    elif rv >= 1.0 and rx_x is not None:
+        x, y, validity = rx_x, rx_y, 1.0
+    else:
+        # skip invalid gaze
+        return None, last_ast
+    # parse location (if present)
+    loc_el = gaze.find('./location')
+    location = None
+    if loc_el is not None:
+        try:
+            location = {
+                'path': loc_el.get('path'),
+                'line': int(loc_el.get('line')) if loc_el.get('line') is not None else None,
+                'column': int(loc_el.get('column')) if loc_el.get('column') is not None else None,
+                'x': int(loc_el.get('x')) if loc_el.get('x') is not None else None,
+                'y': int(loc_el.get('y')) if loc_el.get('y') is not None else None,
+            }
+        except:
+            location = None
+    # parse AST structure (if present)
+    ast_el = gaze.find('./ast_structure')
+    ast = None
+    if ast_el is not None:
+        token = ast_el.get('token')
+        a_type = ast_el.get('type')
+        remark = ast_el.get('remark')
+        # When remark indicates same as last, levels may be absent
+        levels = []
+        for lvl in ast_el.findall('./level'):
+            levels.append({
+                'start': lvl.get('start'),
+                'end': lvl.get('end'),
+                'tag': lvl.get('tag'),
+            })
+        if (
+            (not levels)
+            and remark
+            and 'Same' in remark
+            and last_ast
+            and last_ast.get('token') == token
+            and last_ast.get('type') == a_type
+        ):
+            levels = last_ast.get('levels') or []
+
+        if file_id is None:
+            if location and location.get('path'):
+                file_id = make_file_id(location['path'])
+            else:
+                file_id = make_file_id(xml_path)
+
+        ast = {
+            'token': token,
+            'type': a_type,
+            'levels': levels,
+            'value': token,
+        }
+
+        token_id = make_token_id(file_id, ast)
+        if token_id:
+            ast['token_id'] = token_id
+
+        last_ast = ast
+    return {'t': ts, 'x': x, 'y': y, 'location': location, 'ast': ast}, last_ast
+
+
 def make_file_id(path: Optional[str]) -> str:
     if not path:
         return "unknown"
     return hashlib.sha1(path.encode("utf-8")).hexdigest()[:6]
 
+def paths_match(location_path, code_path):
+    """Whether a project-relative <location path> names the local file `code_path`."""
+    if not location_path:
+        return False
+    rel = location_path.replace("\\", "/").strip("/")
+    full = os.path.abspath(code_path).replace("\\", "/")
+    return full == rel or full.endswith("/" + rel)
+
 def parse_line_col(s):
     if not s or ':' not in s:
         return None, None
@@ -133,9 +213,10 @@ def parse_line_col(s):
     return int(line), int(col)
 
 def ast_span(ast):
+    """Span of the innermost <level> (the first one listed), as resolve_gazes uses."""
     if not ast or not ast.get("levels"):
-        return None, None
-    leaf = ast["levels"][-1]
+        return None
+    leaf = ast["levels"][0]
 
     s_line, s_col = parse_line_col(leaf.get("start"))
     e_line, e_col = parse_line_col(leaf.get("end"))
@@ -149,10 +230,27 @@ def make_token_id(file_id, ast):
         print("No start or end")
         return None
     s_line, s_col, e_line, e_col = span
-    return f"{file_id}:{s_line}:{s_col}-{e_line}:{e_col}"
+    return f"{file_id}:{s_line + IDE_LINE_OFFSET}:{s_col + IDE_COLUMN_OFFSET}-" \
+           f"{e_line + IDE_LINE_OFFSET}:{e_col + IDE_COLUMN_OFFSET}"
+
+def parse_token_span(token_id: Optional[str]):
+    """(start_line, start_col, end_line, end_col) from a "<file_id>:<span>" token id."""
+    try:
+        _, s_line, rest, e_col = token_id.rsplit(":", 3)
+        s_col, e_line = rest.split("-")
+        return int(s_line), int(s_col), int(e_line), int(e_col)
+    except (AttributeError, ValueError):
+        return None
+
+def group_fixations(gazes, max_gap_ms=75, keep_samples=False):
+    """
+    Group gazes with same last token as one group.
 
-def group_fixations(gazes, max_gap_ms=75):
-    """Group gazes with same last token as one group."""
+    Each group keeps running sums of x/y, a sample count and the first
+    sample's token instead of the samples themselves, so memory grows with the
+    number of fixations rather than the number of gazes. Pass
+    `keep_samples=True` to also collect the raw gazes under "samples".
+    """
     fixations = []
     cur = None
 
@@ -161,68 +259,62 @@ def group_fixations(gazes, max_gap_ms=75):
         if ast is None:
             continue # skip whitespace / no token
         tid = ast.get("token_id")
-
-        if fixations and fixations[-1]:
-            index = fixations[-1]["index"] + 1
-        else:
-            index = 1
-
         if tid is None:
             continue # skip whitespace / no token
-        if cur is None:
-            cur = {
-                "index": index,
-                "token_id": tid,
-                "start_time": g["t"],
-                "end_time": g["t"],
-                "samples": [g],
-            }
-            continue
 
         if (
-                tid == cur["token_id"]
+                cur is not None
+                and tid == cur["token_id"]
                 and g["t"] - cur["end_time"] <= max_gap_ms
         ):
             cur["end_time"] = g["t"]
-            cur["samples"].append(g)
-        else:
+            cur["sum_x"] += g["x"]
+            cur["sum_y"] += g["y"]
+            cur["num_samples"] += 1
+            if keep_samples:
+                cur["samples"].append(g)
+            continue
+
+        if cur is not None:
             fixations.append(cur)
 
-            index = fixations[-1]["index"] + 1
-            cur = {
-                "index": index,
-                "token_id": tid,
-                "start_time": g["t"],
-                "end_time": g["t"],
-                "samples": [g],
-            }
+        cur = {
+            "index": len(fixations) + 1,
+            "token_id": tid,
+            "token": ast.get("token"),
+            "start_time": g["t"],
+            "end_time": g["t"],
+            "sum_x": g["x"],
+            "sum_y": g["y"],
+            "num_samples": 1,
+        }
+        if keep_samples:
+            cur["samples"] = [g]
 
     if cur:
         fixations.append(cur)
 
     return fixations
 
-def finalize_fixation(f):
-    xs = [g["x"] for g in f["samples"]]
-    ys = [g["y"] for g in f["samples"]]
-
-    if f['samples'][0]['ast']['token'] is None:
-        value = "N/A"
-    elif f['samples'][0]['ast']['token'] == "\n":
-        value = "Newline"
-    else:
-        value = f['samples'][0]['ast']['token']
+def fixation_value(token):
+    if token is None:
+        return "N/A"
+    if token == "\n":
+        return "Newline"
+    return token
 
+def finalize_fixation(f):
+    n = f["num_samples"]
     return {
         "index": f["index"],
         "token_id": f["token_id"],
         "start_time": f["start_time"],
         "end_time": f["end_time"],
         "duration_ms": f["end_time"] - f["start_time"],
-        "centroid_x": sum(xs) / len(xs),
-        "centroid_y": sum(ys) / len(ys),
-        "num_samples": len(xs),
-        "value": value
+        "centroid_x": f["sum_x"] / n,
+        "centroid_y": f["sum_y"] / n,
+        "num_samples": n,
+        "value": fixation_value(f["token"])
     }
 
 
@@ -234,19 +326,97 @@ def summarize_tokens(tokens):
         summary[token_type] = summary.get(token_type, 0) + 1
     return summary
 
+def calibration_points(gazes):
+    """(t, path, x, y, line, column) for every gaze with a <location>, 1-based."""
+    for g in gazes:
+        loc = g.get('location')
+        if not loc or loc.get('line') is None or loc.get('column') is None:
+            continue
+        yield (g['t'], loc.get('path'), g['x'], g['y'],
+               loc['line'] + IDE_LINE_OFFSET, loc['column'] + IDE_COLUMN_OFFSET)
+
+
+def token_ast(token, source, levels=None):
+    return {
+        'token': token['text'],
+        'type': token['type'],
+        'levels': levels or [],
+        'value': token['text'],
+        'token_id': token['token_id'],
+        'resolved_by': source,
+    }
+
+
+def resolve_gazes(gazes, tokens, code_path, segments=(), screen_tolerance=2):
+    """
+    Relabel gazes onto the extract_tokens token under them, so gazes with and
+    without an AST hit share token ids.
+
+    - AST hits are looked up by the start of their innermost <level>;
+    - gazes with only a <location> by its line/column;
+    - the rest by normalized x/y through the screen segment active at that
+      time, if that segment was recorded on `code_path`.
+    Gazes that cannot be placed keep their AST (if any) and are passed on.
+    """
+    line_index = build_line_index(tokens)
+    segments = list(segments)
+    starts = [seg['start_time'] for seg in segments]
+
+    for g in gazes:
+        ast = g.get('ast')
+        loc = g.get('location')
+        token = None
+        if ast is not None and ast.get('levels'):
+            line, col = parse_line_col(ast['levels'][0].get('start'))
+            if line is not None:
+                token = lookup_token(line_index, line + IDE_LINE_OFFSET, col + IDE_COLUMN_OFFSET)
+            source = 'ast'
+        elif ast is None and loc and loc.get('line') is not None and loc.get('column') is not None:
+            token = lookup_token(line_index, loc['line'] + IDE_LINE_OFFSET,
+                                 loc['column'] + IDE_COLUMN_OFFSET)
+            source = 'location'
+        elif ast is None and not loc and segments:
+            seg = find_segment(segments, starts, g['t'])
+            if seg is not None and paths_match(seg['path'], code_path):
+                pos = segment_position(seg, g['x'], g['y'])
+                if pos is not None:
+                    token = lookup_token(line_index, *pos, tolerance=screen_tolerance)
+            source = 'screen'
+        if token is not None:
+            g['ast'] = token_ast(token, source, ast.get('levels') if ast else None)
+        yield g
+
+
+def iter_session_gazes(xml_path, code_path=None, tokens=None):
+    """
+    Gazes of one recording, restricted to `code_path` when given and resolved
+    onto `tokens` when given. Screen segments are fitted in a first streaming
+    pass, so only per-segment sums are held in memory.
+    """
+    gazes = iter_eye_tracking(xml_path, code_path)
+    if tokens is None:
+        return gazes
+    segments = build_screen_segments(calibration_points(iter_eye_tracking(xml_path)))
+    return resolve_gazes(gazes, tokens, code_path, segments)
+
+
 def compute_fixations(
         xml_path: str,
         max_gap_ms: int = 75,
+        code_path: Optional[str] = None,
+        tokens=None,
 ):
-    gazes = parse_eye_tracking(xml_path)
-    groups = group_fixations(gazes, max_gap_ms=max_gap_ms)
-
-    fixations = [
-        finalize_fixation(f)
-        for f in groups
-    ]
+    """
+    Fixations of one recording. Pass `code_path` to keep only gazes on that
+    file, and its extract_tokens `tokens` to also place gazes without an AST
+    hit onto tokens.
+    """
+    groups = consume_in_time_order(
+        lambda: iter_session_gazes(xml_path, code_path, tokens),
+        lambda gazes: group_fixations(gazes, max_gap_ms=max_gap_ms),
+    )
 
-    return fixations
+    return [finalize_fixation(f) for f in groups]
 
 
 def run(xml_path, vt=0.1, min_dur=80):
@@ -273,7 +443,7 @@ def run(xml_path, vt=0.1, min_dur=80):
         token_id = fix.get("token_id")
         start_time, end_time = fix.get("start_time"), fix.get("end_time")
         print(f"Index: {fix['index']}, Token ID: {token_id}, Start Time: {start_time}, End Time: {end_time}, Duration (ms): {end_time - start_time}")
-        print(f"Number of gazes: {len(fix['samples'])}, Value: {fix['samples'][0]['ast']['token']}")
+        print(f"Number of gazes: {fix['num_samples']}, Value: {fix['token']}")
 
         fixations.append(finalize_fixation(fix))
 
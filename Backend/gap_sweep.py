@@ -0,0 +1,103 @@
+"""
+max_gap_ms parameter sweeps without re-running the pipeline.
+
+group_fixations starts a new fixation whenever the token changes or the gap
+to the previous token-carrying gaze exceeds max_gap_ms. Token changes do not
+depend on the threshold, so after one pass we only need the sorted gaps
+between same-token neighbours: every threshold is then a bisect for counts and
+total dwell, and one linear split for the duration distribution.
+
+Gap Structure Definition:
+gap_structure: {
+    "times": array[int],        # timestamps of gazes that carry a token_id
+    "gaps": array[int],         # gaps[i] = times[i] - times[i - 1]  (gaps[0] = 0)
+    "same_token": bytearray,    # 1 if gaze i has the same token as gaze i - 1
+    "sorted_gaps": List[int],   # same-token gaps, ascending
+    "gap_prefix": List[int],    # prefix sums of sorted_gaps
+    "num_token_runs": int,      # fixation count at max_gap_ms = infinity
+}
+"""
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+
+
+def build_gap_structure(gazes):
+    times = array("q")
+    gaps = array("q")
+    same_token = bytearray()
+    prev_tid = None
+
+    for g in gazes:
+        ast = g.get("ast")
+        tid = ast.get("token_id") if ast else None
+        if tid is None:
+            continue # group_fixations skips these without breaking a group
+        t = g["t"]
+        gaps.append(t - times[-1] if times else 0)
+        same_token.append(1 if times and tid == prev_tid else 0)
+        times.append(t)
+        prev_tid = tid
+
+    sorted_gaps = sorted(gap for gap, same in zip(gaps, same_token) if same)
+    return {
+        "times": times,
+        "gaps": gaps,
+        "same_token": same_token,
+        "sorted_gaps": sorted_gaps,
+        "gap_prefix": [0] + list(accumulate(sorted_gaps)),
+        "num_token_runs": len(times) - len(sorted_gaps),
+    }
+
+
+def count_fixations(structure, max_gap_ms):
+    """Number of fixations group_fixations would produce, in O(log n)."""
+    sorted_gaps = structure["sorted_gaps"]
+    splits = len(sorted_gaps) - bisect_right(sorted_gaps, max_gap_ms)
+    return structure["num_token_runs"] + splits
+
+
+def total_dwell_ms(structure, max_gap_ms):
+    """Sum of fixation durations: every same-token gap that is not split on."""
+    return structure["gap_prefix"][bisect_right(structure["sorted_gaps"], max_gap_ms)]
+
+
+def fixation_durations(structure, max_gap_ms):
+    """Duration of each fixation for this threshold, in time order."""
+    durations = []
+    cur = 0
+    for i, (gap, same) in enumerate(zip(structure["gaps"], structure["same_token"])):
+        if i and same and gap <= max_gap_ms:
+            cur += gap
+            continue
+        if i:
+            durations.append(cur)
+        cur = 0
+    if structure["times"]:
+        durations.append(cur)
+    return durations
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def sweep_max_gap(structure, thresholds):
+    """Fixation count and duration distribution for each max_gap_ms value."""
+    out = []
+    for max_gap_ms in thresholds:
+        durations = sorted(fixation_durations(structure, max_gap_ms))
+        count = len(durations)
+        total = total_dwell_ms(structure, max_gap_ms)
+        out.append({
+            "max_gap_ms": max_gap_ms,
+            "num_fixations": count,
+            "total_dwell_ms": total,
+            "mean_duration_ms": total / count if count else 0,
+            "median_duration_ms": _percentile(durations, 0.5),
+            "p90_duration_ms": _percentile(durations, 0.9),
+            "max_duration_ms": durations[-1] if durations else 0,
+        })
+    return out
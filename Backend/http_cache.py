@@ -0,0 +1,127 @@
+"""
+Conditional-request and compression helpers for the analysis endpoints.
+
+ETags are derived from the (path, size, mtime) fingerprint of every input file
+plus the request parameters and PAYLOAD_VERSION, so a handler can answer
+If-None-Match with a 304 before parsing anything. Bump PAYLOAD_VERSION whenever
+the shape of a response changes (e.g. the token id format) so clients holding
+an old ETag get the new payload instead of a 304.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+MIN_COMPRESS_BYTES = 1024
+PAYLOAD_VERSION = 2
+
+
+def file_fingerprint(path):
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+def make_etag(paths, params):
+    raw = json.dumps(
+        {"version": PAYLOAD_VERSION, "files": [file_fingerprint(p) for p in paths], "params": params},
+        sort_keys=True,
+    )
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag):
+    """If-None-Match uses weak comparison, so W/ validators match too."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate[:2].upper() == "W/":
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        # encoded representations carry a "-gzip"/"-br" suffix
+        if candidate == base or candidate.rsplit("-", 1)[0] == base:
+            return True
+    return False
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+
+
+def _quality(params):
+    for param in params.split(";"):
+        name, _, value = param.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def choose_encoding(accept_encoding):
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        accepted[name.strip().lower()] = _quality(params)
+    options = [enc for enc in ("br", "gzip") if enc != "br" or brotli is not None]
+    options = [enc for enc in options if accepted.get(enc, accepted.get("*", 0.0)) > 0]
+    if not options:
+        return None
+    # highest q wins; br before gzip on a tie
+    return max(options, key=lambda enc: accepted.get(enc, accepted.get("*", 0.0)))
+
+
+def encode_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def json_response(request: Request, payload, etag):
+    """Serialize `payload` and compress it if the client accepts it and it is large enough."""
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+
+    encoding = None
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if encoding:
+        body = encode_body(body, encoding)
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = etag[:-1] + "-" + encoding + '"'
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+if __name__ == '__main__':
+    # Rough bytes-on-wire comparison on the sample recording, scaled up.
+    import sys
+    import time
+    from fixation_finder import compute_fixations
+
+    xml_path = sys.argv[1] if len(sys.argv) > 1 else '../data/eye_tracking.xml'
+    scale = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    fixations = compute_fixations(xml_path) * scale
+    body = json.dumps({"fixations": fixations}, separators=(",", ":")).encode("utf-8")
+    print(f"{len(fixations)} fixations, identity: {len(body)} bytes")
+    for enc in ("gzip", "br"):
+        if enc == "br" and brotli is None:
+            continue
+        t0 = time.perf_counter()
+        out = encode_body(body, enc)
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"{enc}: {len(out)} bytes ({len(out) / len(body):.1%}), {ms:.1f} ms to encode")
@@ -0,0 +1,370 @@
+"""
+Background precomputation of session analyses.
+
+A session is an eye-tracking recording (any `*eye_tracking*.xml` below the
+data directory) paired with a source file it was recorded against. Code
+targets are derived from the recording itself: every <location path> the
+gazes fall on, resolved against the source root (the configured one, or the
+project_path in the `*ide_tracking*.xml` next to the recording), with the
+language taken from the file extension. A `session.json` next to the
+recording ({"code_path": ..., "language": ...}, relative to that directory)
+adds a target explicitly, and clients register pairs they ask for. The queue
+scans the data directory, and every new or changed recording is re-analyzed
+on a bounded thread pool for each of its targets.
+
+A target that fails is retried with exponential backoff and given up after
+MAX_ATTEMPTS until its input files change. Job records and cached results are
+capped at MAX_JOBS and MAX_RESULTS (least recently used results go first).
+Results are cached under the same fingerprint key used for ETags, so a request
+handler can serve them without touching the XML.
+
+Job Definition:
+job: {
+    "job_id": str,
+    "session_id": str,
+    "xml_path": str,
+    "code_path": str,
+    "language": str,
+    "status": "queued" | "running" | "done" | "failed",
+    "stage": str,          # one of STAGES while running
+    "progress": float,     # 0..1
+    "error": Optional[str],
+}
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fixation_finder import compute_fixations, make_file_id, iter_eye_tracking
+from tokenize_code import extract_ast_nodes, extract_code_string
+from token_index import build_token_index, attach_fixations_to_tokens
+from stats import compute_stats
+from http_cache import make_etag
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("tokenize", "fixations", "attach", "stats")
+
+LANGUAGES = {
+    ".py": "python",
+    ".java": "java",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "tsx",
+    ".c": "c",
+    ".h": "c",
+    ".cpp": "cpp",
+    ".cc": "cpp",
+    ".hpp": "cpp",
+    ".cs": "c_sharp",
+    ".go": "go",
+    ".rs": "rust",
+    ".rb": "ruby",
+    ".php": "php",
+    ".kt": "kotlin",
+}
+
+MAX_ATTEMPTS = 3
+RETRY_BASE_S = 60
+MAX_JOBS = 200
+MAX_RESULTS = 32
+
+
+def result_key(xml_path, code_path, language, max_gap_ms):
+    return make_etag([xml_path, code_path], {"language": language, "max_gap_ms": max_gap_ms})
+
+
+def analyze_session(xml_path, code_path, language, max_gap_ms=75, on_stage=None):
+    """
+    Full /api/fixations pipeline: tokenize, fixations (streamed parse, gaze
+    resolution and grouping), attach, stats. Paths are made absolute first,
+    so the payload does not depend on how they were spelled. `on_stage(name)`
+    is called before each stage.
+    """
+    def stage(name):
+        if on_stage is not None:
+            on_stage(name)
+
+    # file and token ids hash the path string, so every caller gets the same spelling
+    xml_path = os.path.abspath(xml_path)
+    code_path = os.path.abspath(code_path)
+
+    stage("tokenize")
+    code_string = extract_code_string(code_path)
+    tokens, nodes = extract_ast_nodes(code_string, language, code_path)
+
+    stage("fixations")
+    fixations = compute_fixations(xml_path, max_gap_ms, code_path=code_path, tokens=tokens)
+
+    stage("attach")
+    token_index = build_token_index(tokens)
+    attach_fixations_to_tokens(token_index, fixations)
+
+    stage("stats")
+    for token in token_index.values():
+        token["attention"] = compute_stats(token)
+
+    return {
+        "file": {
+            "file_id": make_file_id(code_path),
+            "path": code_path,
+            "language": language,
+            "code": code_string
+        },
+        "code_str": code_string,
+        "tokens": list(token_index.values()),
+        "nodes": nodes,
+        "fixations": fixations
+    }
+
+
+def ide_project_path(xml_path):
+    """project_path from the <environment> of the ide_tracking.xml next to a recording."""
+    for ide_xml in sorted(glob.glob(os.path.join(os.path.dirname(xml_path), "*ide_tracking*.xml"))):
+        try:
+            for _, el in ET.iterparse(ide_xml):
+                if el.tag == "environment":
+                    return el.get("project_path")
+        except (OSError, ET.ParseError) as e:
+            logger.warning("ignoring %s: %s", ide_xml, e)
+    return None
+
+
+def recorded_targets(xml_path, source_root=None):
+    """
+    (abs code path, language) for every file the recording's gazes fall on
+    that exists under the source root and has a known language.
+    """
+    root = source_root or ide_project_path(xml_path)
+    if not root:
+        return set()
+    paths = set()
+    for g in iter_eye_tracking(xml_path):
+        loc = g.get("location")
+        if loc and loc.get("path"):
+            paths.add(loc["path"])
+
+    targets = set()
+    for path in paths:
+        language = LANGUAGES.get(os.path.splitext(path)[1].lower())
+        code_path = os.path.abspath(os.path.join(root, path.replace("\\", "/").lstrip("/")))
+        if language and os.path.isfile(code_path):
+            targets.add((code_path, language))
+    return targets
+
+
+class PrecomputeQueue:
+    def __init__(self, data_dir, max_workers=2, max_gap_ms=75, source_root=None):
+        self.data_dir = data_dir
+        self.max_gap_ms = max_gap_ms
+        self.source_root = source_root
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="precompute")
+        self._lock = threading.Lock()
+        self._targets = {}    # abs xml path -> set of (abs code path, language)
+        self._scanned = {}    # abs xml path -> fingerprint its targets were derived at
+        self._results = OrderedDict()  # result_key -> payload, least recently used first
+        self._latest = {}     # (xml path, code path, language) -> current result_key
+        self._pending = {}    # result_key -> job_id
+        self._failures = {}   # result_key -> (attempts, retry at)
+        self._jobs = OrderedDict()  # job_id -> job, oldest first
+
+    def recordings(self):
+        pattern = os.path.join(self.data_dir, "**", "*eye_tracking*.xml")
+        return sorted(os.path.abspath(p) for p in glob.glob(pattern, recursive=True))
+
+    def _sidecar_target(self, xml_path):
+        sidecar = os.path.join(os.path.dirname(xml_path), "session.json")
+        if not os.path.exists(sidecar):
+            return None
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                conf = json.load(f)
+            code_path = os.path.join(os.path.dirname(sidecar), conf["code_path"])
+            return os.path.abspath(code_path), conf["language"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("ignoring %s: %s", sidecar, e)
+            return None
+
+    def _discover_targets(self, xml_path):
+        """Targets from the recording and its session.json; re-derived only when the recording changes."""
+        try:
+            fingerprint = os.stat(xml_path).st_mtime_ns
+        except OSError:
+            return set()
+        with self._lock:
+            if self._scanned.get(xml_path) == fingerprint:
+                return set()
+        try:
+            targets = recorded_targets(xml_path, self.source_root)
+        except (OSError, ET.ParseError) as e:
+            logger.warning("cannot read %s: %s", xml_path, e)
+            targets = set()
+        sidecar = self._sidecar_target(xml_path)
+        if sidecar is not None:
+            targets.add(sidecar)
+        with self._lock:
+            self._scanned[xml_path] = fingerprint
+        return targets
+
+    def register_target(self, xml_path, code_path, language):
+        """Remember that `xml_path` should be analyzed against `code_path`, and queue it."""
+        xml_path = os.path.abspath(xml_path)
+        code_path = os.path.abspath(code_path)
+        with self._lock:
+            self._targets.setdefault(xml_path, set()).add((code_path, language))
+        return self._submit(xml_path, code_path, language)
+
+    def scan(self):
+        """Queue every registered recording/code pair whose inputs are new or changed."""
+        queued = []
+        for xml_path in self.recordings():
+            discovered = self._discover_targets(xml_path)
+            with self._lock:
+                targets = self._targets.setdefault(xml_path, set())
+                targets.update(discovered)
+                targets = sorted(targets)
+            for code_path, language in targets:
+                job = self._submit(xml_path, code_path, language)
+                if job is not None:
+                    queued.append(job)
+        return queued
+
+    def _submit(self, xml_path, code_path, language):
+        try:
+            key = result_key(xml_path, code_path, language, self.max_gap_ms)
+        except OSError:
+            return None  # file vanished between scan and submit
+        with self._lock:
+            if key in self._results:
+                return None
+            if key in self._pending:
+                return dict(self._jobs[self._pending[key]])
+            attempts, retry_at = self._failures.get(key, (0, 0))
+            if attempts >= MAX_ATTEMPTS or time.time() < retry_at:
+                return None
+            job = {
+                "job_id": uuid.uuid4().hex[:12],
+                "session_id": make_file_id(xml_path),
+                "xml_path": xml_path,
+                "code_path": code_path,
+                "language": language,
+                "status": "queued",
+                "stage": None,
+                "progress": 0.0,
+                "error": None,
+            }
+            self._jobs[job["job_id"]] = job
+            self._pending[key] = job["job_id"]
+            self._prune_jobs()
+            snapshot = dict(job)
+        self._pool.submit(self._run, key, job)
+        return snapshot
+
+    def _run(self, key, job):
+        def on_stage(name):
+            with self._lock:
+                job["stage"] = name
+                job["progress"] = STAGES.index(name) / len(STAGES)
+
+        with self._lock:
+            job["status"] = "running"
+        try:
+            payload = analyze_session(job["xml_path"], job["code_path"], job["language"],
+                                      self.max_gap_ms, on_stage=on_stage)
+        except Exception as e:
+            logger.exception("precompute failed for %s", job["xml_path"])
+            with self._lock:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                self._pending.pop(key, None)
+                attempts = self._failures.get(key, (0, 0))[0] + 1
+                self._failures[key] = (attempts, time.time() + RETRY_BASE_S * 2 ** (attempts - 1))
+                while len(self._failures) > MAX_JOBS:
+                    del self._failures[next(iter(self._failures))]
+            return
+        with self._lock:
+            self._remember(job["xml_path"], job["code_path"], job["language"], key, payload)
+            self._pending.pop(key, None)
+            job["status"] = "done"
+            job["stage"] = None
+            job["progress"] = 1.0
+
+    def get_result(self, xml_path, code_path, language, max_gap_ms):
+        """Return the precomputed payload for these inputs, or None if not ready."""
+        if max_gap_ms != self.max_gap_ms:
+            return None
+        try:
+            key = result_key(xml_path, code_path, language, max_gap_ms)
+        except OSError:
+            return None
+        with self._lock:
+            payload = self._results.get(key)
+            if payload is not None:
+                self._results.move_to_end(key)
+            return payload
+
+    def store_result(self, xml_path, code_path, language, max_gap_ms, payload):
+        """Cache a payload computed on the request path."""
+        if max_gap_ms != self.max_gap_ms:
+            return
+        key = result_key(xml_path, code_path, language, max_gap_ms)
+        with self._lock:
+            self._remember(os.path.abspath(xml_path), os.path.abspath(code_path), language, key, payload)
+
+    def _remember(self, xml_path, code_path, language, key, payload):
+        # drop the result for the previous version of these files; caller holds the lock
+        old = self._latest.get((xml_path, code_path, language))
+        if old is not None and old != key:
+            self._results.pop(old, None)
+        self._latest[(xml_path, code_path, language)] = key
+        self._results[key] = payload
+        self._results.move_to_end(key)
+        self._failures.pop(key, None)
+        while len(self._results) > MAX_RESULTS:
+            self._results.popitem(last=False)
+
+    def _prune_jobs(self):
+        # drop the oldest finished records; caller holds the lock
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= MAX_JOBS:
+                break
+            if self._jobs[job_id]["status"] in ("done", "failed"):
+                del self._jobs[job_id]
+
+    def jobs(self):
+        with self._lock:
+            return [dict(j) for j in self._jobs.values()]
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def start_scanning(self, interval_s):
+        """
+        Scan the data directory on a daemon thread, then rescan every
+        `interval_s` seconds (never again if it is not positive).
+        """
+        def loop():
+            while True:
+                try:
+                    self.scan()
+                except Exception:
+                    logger.exception("precompute scan failed")
+                if interval_s <= 0 or stop.wait(interval_s):
+                    return
+
+        stop = threading.Event()
+        threading.Thread(target=loop, name="precompute-scan", daemon=True).start()
+        return stop
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,25 +1,43 @@
 # server.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import os
 import logging
 
 # import functions from your uploaded fixation_finder.py
 # make sure fixation_finder.py is in the same folder or in PYTHONPATH
 from fixation_finder import parse_eye_tracking, find_fixations_ivt, group_fixations,\
-    find_saccades_from_fixations, summarize_fixations, merge_fixations, compute_fixations, make_file_id
-from tokenize_code import extract_tokens, extract_code_string
-from token_index import build_token_index, attach_fixations_to_tokens
+    find_saccades_from_fixations, summarize_fixations, merge_fixations, compute_fixations, make_file_id,\
+    iter_session_gazes, consume_in_time_order
+from tokenize_code import extract_tokens, extract_code_string, extract_ast_nodes
+from session_store import init_store, connect_store, ingest_files, list_sessions, sessions_for_token, top_tokens,\
+    fixations_in_window, tokens_in_lines
+from http_cache import make_etag, etag_matches, not_modified, json_response
+from precompute import PrecomputeQueue, analyze_session
+from gap_sweep import build_gap_structure, sweep_max_gap
+from aoi_tree import aggregate_node_dwell, nest_nodes
+from transitions import build_transition_matrix, merge_transition_matrices, top_transitions, node_degrees,\
+    token_key, enclosing_node_key
 
 app = FastAPI()
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+STORE_DB = os.environ.get("SESSION_STORE_DB", "session_store.sqlite3")
+
+DATA_DIR = os.environ.get("PRECOMPUTE_DATA_DIR", "../data")
+precompute = PrecomputeQueue(
+    DATA_DIR,
+    max_workers=int(os.environ.get("PRECOMPUTE_WORKERS", "2")),
+    source_root=os.environ.get("PRECOMPUTE_SOURCE_ROOT") or None,
+)
+PRECOMPUTE_SCAN_INTERVAL_S = float(os.environ.get("PRECOMPUTE_SCAN_INTERVAL_S", "30"))
+
 # Allow your local React dev server
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +45,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 class FixationOut(BaseModel):
@@ -47,6 +66,35 @@ class FixationRequest(BaseModel):
     language: str
     max_gap_ms: int = 75
 
+class IngestRequest(BaseModel):
+    xml_path: str
+    code_path: str
+    language: str
+    session_id: Optional[str] = None
+    max_gap_ms: int = 75
+
+class AOIRequest(BaseModel):
+    xml_path: str
+    code_path: str
+    language: str
+    max_gap_ms: int = 75
+    max_depth: Optional[int] = None
+
+class SweepRequest(BaseModel):
+    xml_path: str
+    thresholds: List[int]
+    code_path: Optional[str] = None
+    language: Optional[str] = None
+
+class TransitionRequest(BaseModel):
+    xml_paths: List[str]
+    max_gap_ms: int = 75
+    top_k: int = 10
+    code_path: Optional[str] = None
+    language: Optional[str] = None
+    group_by: str = "token"     # "token" or "node" (enclosing AST node, needs code_path)
+    node_types: Optional[List[str]] = None
+
 # class Token_Group(BaseModel):
 #     token: str
 #     gazes: List[Dict[str, Any]]
@@ -138,32 +186,196 @@ def metadata():
 #     return groups
 
 @app.post("/api/fixations")
-def get_fixations(req: FixationRequest):
-    file_id = make_file_id(req.code_path)
-    code_string = extract_code_string(req.code_path)
-    file = {
-        "file_id": file_id,
-        "path": req.code_path,
-        "language": req.language,
-        "code": code_string
-    }
-    fixations = compute_fixations(req.xml_path)
-
-    tokens = extract_tokens(code_string, req.language, req.code_path)
-    token_index = build_token_index(tokens)
-
-    attach_fixations_to_tokens(token_index, fixations)
-    return {
-        "file": file,
-        "code_str": code_string,
-        "tokens": list(token_index.values()),
-        "fixations": fixations
-    }
-    fixations = compute_fixations(req.xml_path)
-    return {
-        "num_fixations": len(fixations),
-        "fixations": fixations
-    }
+def get_fixations(req: FixationRequest, request: Request):
+    for path in (req.xml_path, req.code_path):
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"{path} not found")
+    etag = make_etag([req.xml_path, req.code_path], req.dict())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    payload = precompute.get_result(req.xml_path, req.code_path, req.language, req.max_gap_ms)
+    if payload is None:
+        payload = analyze_session(req.xml_path, req.code_path, req.language, req.max_gap_ms)
+        precompute.store_result(req.xml_path, req.code_path, req.language, req.max_gap_ms, payload)
+        # keep this pair warm when the recording or source changes
+        precompute.register_target(req.xml_path, req.code_path, req.language)
+    return json_response(request, payload, etag)
+
+@app.post("/api/fixations/sweep")
+def sweep_fixations(req: SweepRequest, request: Request):
+    """
+    Fixation counts and duration distributions for several max_gap_ms values,
+    from a single parse of the recording. With code_path/language the gazes
+    are resolved exactly as /api/fixations does, so the counts agree.
+    """
+    paths = [p for p in (req.xml_path, req.code_path) if p]
+    for path in paths:
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"{path} not found")
+    if req.code_path and not req.language:
+        raise HTTPException(status_code=422, detail="language is required with code_path")
+    etag = make_etag(paths, req.dict())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    tokens = None
+    if req.code_path:
+        tokens = extract_tokens(extract_code_string(req.code_path), req.language, req.code_path)
+    structure = consume_in_time_order(
+        lambda: iter_session_gazes(req.xml_path, req.code_path, tokens),
+        build_gap_structure,
+    )
+    return json_response(request, {
+        "num_gazes": len(structure["times"]),
+        "sweep": sweep_max_gap(structure, req.thresholds)
+    }, etag)
+
+@app.post("/api/aoi")
+def get_aoi_tree(req: AOIRequest, request: Request):
+    """
+    AST tree of the source file, each node annotated with the dwell time and
+    fixation count of every token it encloses (functions, classes, blocks, ...).
+    """
+    for path in (req.xml_path, req.code_path):
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"{path} not found")
+    etag = make_etag([req.xml_path, req.code_path], req.dict())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    payload = precompute.get_result(req.xml_path, req.code_path, req.language, req.max_gap_ms)
+    if payload is None:
+        payload = analyze_session(req.xml_path, req.code_path, req.language, req.max_gap_ms)
+        precompute.store_result(req.xml_path, req.code_path, req.language, req.max_gap_ms, payload)
+
+    # the payload may be cached, so annotate copies of its nodes
+    nodes = [dict(n) for n in payload["nodes"]]
+    aggregate_node_dwell(payload["tokens"], nodes, payload["fixations"])
+    return json_response(request, {
+        "file": {k: v for k, v in payload["file"].items() if k != "code"},
+        "num_nodes": len(nodes),
+        "tree": nest_nodes(nodes, req.max_depth)
+    }, etag)
+
+@app.post("/api/transitions")
+def get_transitions(req: TransitionRequest, request: Request):
+    """
+    Aggregate token -> token jumps over one or more sessions and return the
+    most frequent transitions plus in/out degree per token. Labels are
+    "<file_id>:<span>" with the file identified by its project path (or by
+    code_path when given), so recordings of the same file merge. With
+    group_by="node" the graph is over enclosing AST nodes instead.
+    """
+    paths = req.xml_paths + ([req.code_path] if req.code_path else [])
+    for path in paths:
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"{path} not found")
+    if req.group_by not in ("token", "node"):
+        raise HTTPException(status_code=422, detail="group_by must be 'token' or 'node'")
+    if (req.code_path or req.group_by == "node") and not (req.code_path and req.language):
+        raise HTTPException(status_code=422, detail="code_path and language are required together")
+    etag = make_etag(paths, req.dict())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    tokens = None
+    key = token_key
+    # token ids hash the path string, so always use its absolute spelling
+    code_path = os.path.abspath(req.code_path) if req.code_path else None
+    if code_path:
+        code_string = extract_code_string(code_path)
+        tokens, nodes = extract_ast_nodes(code_string, req.language, code_path)
+        if req.group_by == "node":
+            key = enclosing_node_key(tokens, nodes, make_file_id(code_path), req.node_types)
+
+    matrices = []
+    for xml_path in req.xml_paths:
+        fixations = compute_fixations(xml_path, max_gap_ms=req.max_gap_ms,
+                                      code_path=code_path, tokens=tokens)
+        matrices.append(build_transition_matrix(fixations, key=key))
+    matrix = merge_transition_matrices(matrices)
+
+    return json_response(request, {
+        "num_sessions": matrix["num_sessions"],
+        "num_tokens": len(matrix["labels"]),
+        "num_transitions": sum(matrix["counts"].values()),
+        "top_transitions": top_transitions(matrix, req.top_k),
+        "degrees": node_degrees(matrix)
+    }, etag)
+
+@app.on_event("startup")
+def start_store():
+    init_store(STORE_DB)
+
+def get_store():
+    conn = connect_store(STORE_DB)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+@app.post("/api/store/sessions")
+def ingest_store_session(req: IngestRequest, store=Depends(get_store)):
+    for path in (req.xml_path, req.code_path):
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"{path} not found")
+    return ingest_files(store, req.xml_path, req.code_path, req.language,
+                        session_id=req.session_id, max_gap_ms=req.max_gap_ms)
+
+@app.get("/api/store/sessions")
+def get_store_sessions(store=Depends(get_store)):
+    return list_sessions(store)
+
+@app.get("/api/store/token_sessions")
+def get_token_sessions(file_id: str, token_id: str, min_dwell_ms: int = 0, store=Depends(get_store)):
+    """Which sessions fixated on `token_id` in `file_id` for more than `min_dwell_ms`."""
+    return sessions_for_token(store, file_id, token_id, min_dwell_ms)
+
+@app.get("/api/store/top_tokens")
+def get_top_tokens(file_id: str, limit: int = 20, store=Depends(get_store)):
+    return top_tokens(store, file_id, limit)
+
+@app.get("/api/store/fixations")
+def get_store_fixations(session_id: str, start_time: int = 0, end_time: int = 2**62, store=Depends(get_store)):
+    return fixations_in_window(store, session_id, start_time, end_time)
+
+@app.get("/api/store/tokens")
+def get_store_tokens(file_id: str, start_line: int, end_line: int, store=Depends(get_store)):
+    return tokens_in_lines(store, file_id, start_line, end_line)
+
+@app.on_event("startup")
+def start_precompute():
+    # the first scan reads every recording, so it must not hold up startup
+    precompute.start_scanning(PRECOMPUTE_SCAN_INTERVAL_S)
+
+@app.on_event("shutdown")
+def stop_precompute():
+    precompute.shutdown()
+
+@app.post("/api/precompute/scan")
+def scan_precompute():
+    """Queue new or changed sessions under the data directory."""
+    return precompute.scan()
+
+@app.post("/api/precompute/targets")
+def add_precompute_target(req: FixationRequest):
+    """Register a recording/source pair for background precomputation."""
+    for path in (req.xml_path, req.code_path):
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"{path} not found")
+    return precompute.register_target(req.xml_path, req.code_path, req.language) or {"status": "done"}
+
+@app.get("/api/precompute/jobs")
+def get_precompute_jobs():
+    return precompute.jobs()
+
+@app.get("/api/precompute/jobs/{job_id}")
+def get_precompute_job(job_id: str):
+    job = precompute.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
 
 if __name__ == "__main__":
     # run uvicorn: uvicorn server:app --reload
@@ -0,0 +1,264 @@
+"""
+Session Store Definition (SQLite):
+sessions(session_id, xml_path, code_path, file_id, language, num_fixations, num_tokens)
+fixations(session_id, file_id, idx, token_id, start_line, start_col, end_line, end_col,
+          start_time, end_time, duration_ms, centroid_x, centroid_y, num_samples, value)
+tokens(session_id, file_id, token_id, type, text, start_line, start_col, end_line, end_col)
+token_stats(session_id, file_id, start_line, start_col, end_line, end_col, token_id,
+            fixation_count, total_dwell_ms)
+
+file_id is make_file_id of the absolute code_path and spans are 1-based like
+extract_tokens, so fixations, tokens and aggregates of different recordings
+of one source file join on (file_id, span), however the path was spelled. One row set per ingested session; re-ingesting a
+session replaces its rows.
+"""
+import os
+import sqlite3
+
+from fixation_finder import compute_fixations, make_file_id, parse_token_span
+from tokenize_code import extract_tokens, extract_code_string
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    xml_path TEXT NOT NULL,
+    code_path TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    num_fixations INTEGER NOT NULL,
+    num_tokens INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fixations (
+    session_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    token_id TEXT NOT NULL,
+    start_line INTEGER,
+    start_col INTEGER,
+    end_line INTEGER,
+    end_col INTEGER,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    duration_ms INTEGER NOT NULL,
+    centroid_x REAL,
+    centroid_y REAL,
+    num_samples INTEGER,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    session_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    token_id TEXT NOT NULL,
+    type TEXT,
+    text TEXT,
+    start_line INTEGER,
+    start_col INTEGER,
+    end_line INTEGER,
+    end_col INTEGER
+);
+CREATE TABLE IF NOT EXISTS token_stats (
+    session_id TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    start_line INTEGER NOT NULL,
+    start_col INTEGER NOT NULL,
+    end_line INTEGER NOT NULL,
+    end_col INTEGER NOT NULL,
+    token_id TEXT NOT NULL,
+    fixation_count INTEGER NOT NULL,
+    total_dwell_ms INTEGER NOT NULL,
+    PRIMARY KEY (session_id, file_id, start_line, start_col, end_line, end_col)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_file ON sessions(file_id);
+CREATE INDEX IF NOT EXISTS idx_fixations_session_time ON fixations(session_id, start_time);
+CREATE INDEX IF NOT EXISTS idx_fixations_span ON fixations(file_id, start_line, start_col, end_line, end_col);
+CREATE INDEX IF NOT EXISTS idx_tokens_span ON tokens(file_id, start_line, end_line);
+CREATE INDEX IF NOT EXISTS idx_tokens_session ON tokens(session_id);
+CREATE INDEX IF NOT EXISTS idx_token_stats_span ON token_stats(
+    file_id, start_line, start_col, end_line, end_col, total_dwell_ms);
+"""
+
+
+def init_store(db_path="session_store.sqlite3"):
+    """Create the schema if it does not exist. Call once at startup."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def connect_store(db_path="session_store.sqlite3"):
+    """
+    A new connection for one request. Connections must not be shared between
+    concurrent requests; SQLite itself serializes writers across connections.
+    """
+    # FastAPI may open and use the connection from different pool threads,
+    # but never from two at once
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _span_columns(token_id):
+    return parse_token_span(token_id) or (None, None, None, None)
+
+
+def ingest_session(conn, session_id, xml_path, code_path, language, fixations, tokens):
+    """
+    Bulk-insert one session's fixations and tokens and rebuild its per-token
+    aggregates, all in a single transaction. Fixations should come from
+    compute_fixations(..., code_path=code_path) so their ids use the same
+    file id as the tokens.
+    """
+    code_path = os.path.abspath(code_path)
+    file_id = make_file_id(code_path)
+
+    fixation_rows = [
+        (
+            session_id, file_id, f["index"], f["token_id"], *_span_columns(f["token_id"]),
+            f["start_time"], f["end_time"], f["duration_ms"],
+            f["centroid_x"], f["centroid_y"], f["num_samples"], f["value"],
+        )
+        for f in fixations
+    ]
+    token_rows = [
+        (
+            session_id, file_id, t["token_id"], t["type"], t["text"],
+            t["start"]["line"], t["start"]["column"],
+            t["end"]["line"], t["end"]["column"],
+        )
+        for t in tokens
+    ]
+
+    with conn:
+        for table in ("sessions", "fixations", "tokens", "token_stats"):
+            conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        conn.execute(
+            "INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, xml_path, code_path, file_id, language,
+             len(fixation_rows), len(token_rows)),
+        )
+        conn.executemany(
+            "INSERT INTO fixations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            fixation_rows,
+        )
+        conn.executemany(
+            "INSERT INTO tokens VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            token_rows,
+        )
+        conn.execute(
+            """
+            INSERT INTO token_stats
+            SELECT session_id, file_id, start_line, start_col, end_line, end_col,
+                   MIN(token_id), COUNT(*), SUM(duration_ms)
+            FROM fixations
+            WHERE session_id = ? AND start_line IS NOT NULL
+            GROUP BY file_id, start_line, start_col, end_line, end_col
+            """,
+            (session_id,),
+        )
+
+    return {
+        "session_id": session_id,
+        "file_id": file_id,
+        "num_fixations": len(fixation_rows),
+        "num_tokens": len(token_rows),
+    }
+
+
+def ingest_files(conn, xml_path, code_path, language, session_id=None, max_gap_ms=75):
+    """Run the fixation and tokenizer pipeline on a recording and store it."""
+    if session_id is None:
+        session_id = make_file_id(xml_path)
+    # token ids hash the path, so "foo.py" and "/abs/foo.py" must become one spelling
+    code_path = os.path.abspath(code_path)
+    code_string = extract_code_string(code_path)
+    tokens = extract_tokens(code_string, language, code_path)
+    fixations = compute_fixations(xml_path, max_gap_ms=max_gap_ms, code_path=code_path, tokens=tokens)
+    return ingest_session(conn, session_id, xml_path, code_path, language, fixations, tokens)
+
+
+def list_sessions(conn):
+    rows = conn.execute("SELECT * FROM sessions ORDER BY session_id").fetchall()
+    return [dict(r) for r in rows]
+
+
+def sessions_for_token(conn, file_id, token_id, min_dwell_ms=0):
+    """
+    Sessions whose total dwell on the token in `file_id` exceeds `min_dwell_ms`.
+    The token is matched by the span in `token_id`, not the id string.
+    """
+    span = parse_token_span(token_id)
+    if span is None:
+        return []
+    rows = conn.execute(
+        """
+        SELECT session_id, fixation_count, total_dwell_ms
+        FROM token_stats
+        WHERE file_id = ? AND start_line = ? AND start_col = ? AND end_line = ? AND end_col = ?
+              AND total_dwell_ms > ?
+        ORDER BY total_dwell_ms DESC
+        """,
+        (file_id, *span, min_dwell_ms),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def top_tokens(conn, file_id, limit=20):
+    """Tokens in `file_id` ranked by dwell summed over every session."""
+    rows = conn.execute(
+        """
+        SELECT MIN(token_id) AS token_id, start_line, start_col, end_line, end_col,
+               COUNT(DISTINCT session_id) AS num_sessions,
+               SUM(fixation_count) AS fixation_count,
+               SUM(total_dwell_ms) AS total_dwell_ms
+        FROM token_stats
+        WHERE file_id = ?
+        GROUP BY start_line, start_col, end_line, end_col
+        ORDER BY total_dwell_ms DESC
+        LIMIT ?
+        """,
+        (file_id, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def fixations_in_window(conn, session_id, start_time, end_time):
+    rows = conn.execute(
+        """
+        SELECT * FROM fixations
+        WHERE session_id = ? AND start_time >= ? AND start_time <= ?
+        ORDER BY start_time
+        """,
+        (session_id, start_time, end_time),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def tokens_in_lines(conn, file_id, start_line, end_line):
+    """
+    Distinct tokens of `file_id` overlapping the inclusive line range, with
+    their dwell summed over every session.
+    """
+    rows = conn.execute(
+        """
+        SELECT t.token_id, t.type, t.text, t.start_line, t.start_col, t.end_line, t.end_col,
+               COALESCE((SELECT SUM(s.total_dwell_ms) FROM token_stats s
+                         WHERE s.file_id = t.file_id
+                           AND s.start_line = t.start_line AND s.start_col = t.start_col
+                           AND s.end_line = t.end_line AND s.end_col = t.end_col), 0)
+                   AS total_dwell_ms
+        FROM (SELECT DISTINCT file_id, token_id, type, text, start_line, start_col, end_line, end_col
+              FROM tokens
+              WHERE file_id = ? AND start_line <= ? AND end_line >= ?) t
+        ORDER BY t.start_line, t.start_col
+        """,
+        (file_id, end_line, start_line),
+    ).fetchall()
+    return [dict(r) for r in rows]
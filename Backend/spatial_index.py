@@ -0,0 +1,287 @@
+"""
+Positional lookups used to resolve gazes onto tokens from extract_tokens.
+
+Line Index Definition:
+line_index: Dict[line, {
+    "starts": List[int],   # sorted start column of each token piece on the line
+    "ends": List[int],     # matching exclusive end column
+    "tokens": List[Token],
+}]
+
+Columns follow extract_tokens (1-based, end exclusive). Tokens spanning several
+lines get one piece per line. Each lookup is a bisect on one line, so resolving
+a gaze is O(log tokens-per-line).
+
+Screen Segment Definition:
+segment: {
+    "path": str,                     # <location path> of the calibration gazes
+    "start_time": int, "end_time": int,
+    "line": (slope, intercept),      # line ~ slope * y + intercept
+    "column": (slope, intercept),    # column ~ slope * x + intercept
+    "min_line": int, "max_line": int,
+    "min_x": float, "max_x": float,
+}
+
+A segment is a run of gazes with a <location> on one file during which the
+editor did not scroll: it ends when the path changes or a located gaze is
+more than `residual_lines` off the running fit.
+"""
+from bisect import bisect_right
+
+END_OF_LINE = 1 << 30
+
+
+def build_line_index(tokens):
+    pieces = {}
+    for t in tokens:
+        s_line, s_col = t["start"]["line"], t["start"]["column"]
+        e_line, e_col = t["end"]["line"], t["end"]["column"]
+        for line in range(s_line, e_line + 1):
+            start = s_col if line == s_line else 1
+            end = e_col if line == e_line else END_OF_LINE
+            pieces.setdefault(line, []).append((start, end, t))
+
+    index = {}
+    for line, items in pieces.items():
+        items.sort(key=lambda p: (p[0], p[1]))
+        index[line] = {
+            "starts": [p[0] for p in items],
+            "ends": [p[1] for p in items],
+            "tokens": [p[2] for p in items],
+        }
+    return index
+
+
+def lookup_token(line_index, line, column, tolerance=0):
+    """
+    Token covering (line, column), or the nearest token on that line within
+    `tolerance` columns. Returns None when nothing is close enough.
+    """
+    row = line_index.get(line)
+    if row is None:
+        return None
+    starts, ends = row["starts"], row["ends"]
+    i = bisect_right(starts, column) - 1
+    if i >= 0 and column < ends[i]:
+        return row["tokens"][i]
+    if tolerance <= 0:
+        return None
+
+    best = None
+    best_dist = tolerance + 1
+    if i >= 0:
+        dist = column - ends[i] + 1
+        if dist < best_dist:
+            best, best_dist = row["tokens"][i], dist
+    if i + 1 < len(starts):
+        dist = starts[i + 1] - column
+        if dist < best_dist:
+            best = row["tokens"][i + 1]
+    return best
+
+
+def build_token_order(tokens):
+    """Start/end positions of `tokens` (already in document order) for token_position."""
+    return {
+        "starts": [(t["start"]["line"], t["start"]["column"]) for t in tokens],
+        "ends": [(t["end"]["line"], t["end"]["column"]) for t in tokens],
+    }
+
+
+def token_position(order, span):
+    """
+    Index of the token a (start_line, start_col, end_line, end_col) span falls
+    on: the token containing its start, else the first token starting inside
+    it. One bisect; None if the span covers no token.
+    """
+    if span is None:
+        return None
+    start, end = (span[0], span[1]), (span[2], span[3])
+    starts = order["starts"]
+    i = bisect_right(starts, start) - 1
+    if i >= 0 and start < order["ends"][i]:
+        return i
+    if i + 1 < len(starts) and starts[i + 1] < end:
+        return i + 1
+    return None
+
+
+def _fit(n, s_x, s_xx, s_y, s_xy):
+    var = s_xx - s_x * s_x / n
+    if n < 2 or var <= 1e-12:
+        return None
+    slope = (s_xy - s_x * s_y / n) / var
+    return slope, (s_y - slope * s_x) / n
+
+
+def _new_segment(t, path, x, y, line, column):
+    return {
+        "path": path,
+        "start_time": t, "end_time": t,
+        "min_line": line, "max_line": line,
+        "min_x": x, "max_x": x,
+        # running sums for line ~ y and column ~ x
+        "n": 1,
+        "sy": y, "syy": y * y, "sl": line, "syl": y * line,
+        "sx": x, "sxx": x * x, "sc": column, "sxc": x * column,
+    }
+
+
+def _add_point(seg, t, x, y, line, column):
+    seg["end_time"] = t
+    seg["min_line"] = min(seg["min_line"], line)
+    seg["max_line"] = max(seg["max_line"], line)
+    seg["min_x"] = min(seg["min_x"], x)
+    seg["max_x"] = max(seg["max_x"], x)
+    seg["n"] += 1
+    seg["sy"] += y; seg["syy"] += y * y; seg["sl"] += line; seg["syl"] += y * line
+    seg["sx"] += x; seg["sxx"] += x * x; seg["sc"] += column; seg["sxc"] += x * column
+
+
+def _line_fit(seg):
+    return _fit(seg["n"], seg["sy"], seg["syy"], seg["sl"], seg["syl"])
+
+
+def _finish_segment(seg):
+    n = seg["n"]
+    return {
+        "path": seg["path"],
+        "start_time": seg["start_time"],
+        "end_time": seg["end_time"],
+        "line": _line_fit(seg),
+        "column": _fit(n, seg["sx"], seg["sxx"], seg["sc"], seg["sxc"]),
+        "mean_y": seg["sy"] / n, "mean_line": seg["sl"] / n,
+        "mean_x": seg["sx"] / n, "mean_column": seg["sc"] / n,
+        "min_line": seg["min_line"],
+        "max_line": seg["max_line"],
+        "min_x": seg["min_x"],
+        "max_x": seg["max_x"],
+    }
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def _borrow_slopes(segments):
+    """
+    Line height and character width do not change when the editor scrolls, so
+    a segment without enough spread to fit (e.g. the reader only moved down a
+    column) takes the median slope of the other segments on its file and keeps
+    its own offset.
+    """
+    slopes = {}
+    for s in segments:
+        for axis in ("line", "column"):
+            if s[axis] is not None:
+                slopes.setdefault((s["path"], axis), []).append(s[axis][0])
+
+    out = []
+    for s in segments:
+        for axis, mean_in, mean_out in (("line", "mean_y", "mean_line"),
+                                        ("column", "mean_x", "mean_column")):
+            if s[axis] is None:
+                slope = _median(slopes.get((s["path"], axis), []))
+                if slope is not None:
+                    s[axis] = (slope, s[mean_out] - slope * s[mean_in])
+        if s["line"] is not None and s["column"] is not None:
+            for k in ("mean_y", "mean_line", "mean_x", "mean_column"):
+                del s[k]
+            out.append(s)
+    return out
+
+
+def build_screen_segments(points, residual_lines=1.5, min_points=3):
+    """
+    Split located gazes into no-scroll segments and fit each one.
+
+    `points` yields (t, path, x, y, line, column) in time order, with x/y
+    normalized and line/column in extract_tokens convention. Only running sums
+    are kept per segment. Segments that cannot be fitted on their own borrow
+    the slopes of the other segments on the same file, or are dropped.
+    """
+    segments = []
+    line_slopes = {}   # path -> line slope of its last fitted segment
+    cur = None
+    for t, path, x, y, line, column in points:
+        if cur is not None and path == cur["path"]:
+            fit = _line_fit(cur) if cur["n"] >= min_points else None
+            if fit is None and path in line_slopes:
+                # too few points of our own yet: check against the known line height
+                slope = line_slopes[path]
+                fit = (slope, (cur["sl"] - slope * cur["sy"]) / cur["n"])
+            if fit is None or abs(fit[0] * y + fit[1] - line) <= residual_lines:
+                _add_point(cur, t, x, y, line, column)
+                continue
+        if cur is not None:
+            segments.append(_finish_segment(cur))
+            if segments[-1]["line"] is not None:
+                line_slopes[cur["path"]] = segments[-1]["line"][0]
+        cur = _new_segment(t, path, x, y, line, column)
+    if cur is not None:
+        segments.append(_finish_segment(cur))
+    return _borrow_slopes(segments)
+
+
+def find_segment(segments, starts, t, pad_ms=500):
+    """Segment active at time `t` (within `pad_ms` of its ends); `starts` are its start times."""
+    i = bisect_right(starts, t + pad_ms) - 1
+    if i < 0 or t > segments[i]["end_time"] + pad_ms:
+        return None
+    return segments[i]
+
+
+def segment_position(segment, x, y, line_margin=2, x_margin=0.05):
+    """
+    (line, column) estimated for normalized x/y, or None when the point falls
+    outside the area the segment was calibrated on (e.g. another pane).
+    """
+    if not (segment["min_x"] - x_margin <= x <= segment["max_x"] + x_margin):
+        return None
+    a, b = segment["line"]
+    c, d = segment["column"]
+    line = round(a * y + b)
+    if not (segment["min_line"] - line_margin <= line <= segment["max_line"] + line_margin):
+        return None
+    return line, round(c * x + d)
+
+
+if __name__ == '__main__':
+    # Rough cost of resolve_gazes on synthetic data:
+    # python spatial_index.py [num_gazes] [num_tokens]
+    import random
+    import sys
+    import time
+    from fixation_finder import resolve_gazes
+
+    num_gazes = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    num_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+    per_line = 10
+    tokens = []
+    for i in range(num_tokens):
+        line, col = i // per_line + 1, (i % per_line) * 6 + 1
+        tokens.append({"text": "t", "type": "identifier", "token_id": f"f:{line}:{col}-{line}:{col + 4}",
+                       "start": {"line": line, "column": col}, "end": {"line": line, "column": col + 4}})
+
+    rng = random.Random(0)
+    num_lines = num_tokens // per_line
+    points = []
+    for t in range(0, 1000, 10):
+        x, y = rng.random(), rng.random()
+        points.append((t, "/f.py", x, y, round(40 * y) + 1, round(60 * x) + 1))
+    segments = build_screen_segments(points)
+
+    def gazes():
+        for i in range(num_gazes):
+            if i % 2:
+                # <location> only; IDE positions are 0-based
+                loc = {"path": "/f.py", "line": rng.randrange(num_lines), "column": rng.randrange(60)}
+                yield {"t": 500, "x": 0.5, "y": 0.5, "location": loc, "ast": None}
+            else:
+                yield {"t": 500, "x": rng.random(), "y": rng.random(), "location": None, "ast": None}
+
+    t0 = time.perf_counter()
+    resolved = sum(1 for g in resolve_gazes(gazes(), tokens, "/f.py", segments) if g["ast"])
+    seconds = time.perf_counter() - t0
+    print(f"{num_gazes} gazes against {num_tokens} tokens: {resolved} resolved in {seconds:.2f} s")
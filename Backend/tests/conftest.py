@@ -0,0 +1,25 @@
+import os
+import random
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+XML_PATH = os.path.join(BACKEND_DIR, "..", "data", "eye_tracking.xml")
+THRESHOLDS = [0, 1, 30, 34, 50, 75, 200, 1000, 10 ** 9]
+
+
+def synthetic_gazes(n=2000, seed=7):
+    """Gazes over a few tokens with irregular gaps and some without a token."""
+    rng = random.Random(seed)
+    gazes = []
+    t = 0
+    tid = "f:1:1-1:4"
+    for _ in range(n):
+        t += rng.choice([0, 8, 16, 17, 40, 75, 76, 300])
+        if rng.random() < 0.2:
+            tid = f"f:{rng.randint(1, 4)}:1-1:4"
+        ast = None if rng.random() < 0.1 else {"token_id": tid, "token": "x"}
+        gazes.append({"t": t, "x": rng.random(), "y": rng.random(), "ast": ast})
+    return gazes
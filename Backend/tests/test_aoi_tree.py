@@ -0,0 +1,70 @@
+from aoi_tree import aggregate_node_dwell, nest_nodes
+
+
+def tok(line, start, end):
+    return {"start": {"line": line, "column": start}, "end": {"line": line, "column": end}}
+
+
+def node(type_, parent, depth, first_token, end_token):
+    return {"type": type_, "start": {"line": 1, "column": 1}, "end": {"line": 3, "column": 1},
+            "parent": parent, "depth": depth, "first_token": first_token, "end_token": end_token}
+
+
+# module
+#   function_definition   tokens 0-3
+#     parameters          tokens 1-2
+#     block               token 3
+#   expression_statement  token 4
+TOKENS = [tok(1, 1, 4), tok(1, 5, 6), tok(1, 7, 8), tok(2, 5, 11), tok(3, 1, 2)]
+NODES = [
+    node("module", None, 0, 0, 5),
+    node("function_definition", 0, 1, 0, 4),
+    node("parameters", 1, 2, 1, 3),
+    node("block", 1, 2, 3, 4),
+    node("expression_statement", 0, 1, 4, 5),
+]
+FIXATIONS = [
+    {"token_id": "f:1:1-1:4", "duration_ms": 100},
+    {"token_id": "f:1:5-1:6", "duration_ms": 20},
+    {"token_id": "f:1:7-1:8", "duration_ms": 30},
+    {"token_id": "f:2:5-2:11", "duration_ms": 40},
+    {"token_id": "f:2:5-2:11", "duration_ms": 5},
+    {"token_id": "f:3:1-3:2", "duration_ms": 7},
+    {"token_id": "f:1:4-1:5", "duration_ms": 999},   # whitespace between tokens
+    {"token_id": "f:9:1-9:2", "duration_ms": 999},   # outside the file
+    {"token_id": None, "duration_ms": 999},
+]
+
+
+def totals(tree):
+    return {n["type"]: (n["total_dwell_ms"], n["fixation_count"]) for n in walk(tree)}
+
+
+def walk(tree):
+    for n in tree:
+        yield n
+        yield from walk(n["children"])
+
+
+def test_dwell_adds_up_through_the_tree():
+    nodes = aggregate_node_dwell(TOKENS, [dict(n) for n in NODES], FIXATIONS)
+    tree = nest_nodes(nodes)
+
+    assert totals(tree) == {
+        "module": (202, 6),
+        "function_definition": (195, 5),
+        "parameters": (50, 2),
+        "block": (45, 2),
+        "expression_statement": (7, 1),
+    }
+    for n in walk(tree):
+        own = n["total_dwell_ms"] - sum(c["total_dwell_ms"] for c in n["children"])
+        assert own >= 0  # children never account for more than their parent
+    assert [c["type"] for c in tree[0]["children"]] == ["function_definition", "expression_statement"]
+
+
+def test_max_depth_prunes_without_changing_totals():
+    nodes = aggregate_node_dwell(TOKENS, [dict(n) for n in NODES], FIXATIONS)
+    tree = nest_nodes(nodes, max_depth=1)
+    assert [c["children"] for c in tree[0]["children"]] == [[], []]
+    assert tree[0]["total_dwell_ms"] == 202
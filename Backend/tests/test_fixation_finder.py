@@ -0,0 +1,106 @@
+import pytest
+
+from fixation_finder import parse_eye_tracking, iter_eye_tracking, group_fixations, \
+    finalize_fixation, compute_fixations, consume_in_time_order
+from conftest import XML_PATH, THRESHOLDS, synthetic_gazes
+
+
+def baseline_group_fixations(gazes, max_gap_ms=75):
+    """group_fixations as it was before the running-accumulator refactor."""
+    fixations = []
+    cur = None
+    for g in gazes:
+        ast = g.get("ast")
+        if ast is None:
+            continue
+        tid = ast.get("token_id")
+        if tid is None:
+            continue
+        if cur is not None and tid == cur["token_id"] and g["t"] - cur["end_time"] <= max_gap_ms:
+            cur["end_time"] = g["t"]
+            cur["samples"].append(g)
+            continue
+        if cur is not None:
+            fixations.append(cur)
+        cur = {
+            "index": len(fixations) + 1,
+            "token_id": tid,
+            "start_time": g["t"],
+            "end_time": g["t"],
+            "samples": [g],
+        }
+    if cur:
+        fixations.append(cur)
+    return fixations
+
+
+def baseline_finalize_fixation(f):
+    xs = [g["x"] for g in f["samples"]]
+    ys = [g["y"] for g in f["samples"]]
+    token = f["samples"][0]["ast"]["token"]
+    if token is None:
+        value = "N/A"
+    elif token == "\n":
+        value = "Newline"
+    else:
+        value = token
+    return {
+        "index": f["index"],
+        "token_id": f["token_id"],
+        "start_time": f["start_time"],
+        "end_time": f["end_time"],
+        "duration_ms": f["end_time"] - f["start_time"],
+        "centroid_x": sum(xs) / len(xs),
+        "centroid_y": sum(ys) / len(ys),
+        "num_samples": len(xs),
+        "value": value,
+    }
+
+
+def baseline(gazes, max_gap_ms):
+    return [baseline_finalize_fixation(f) for f in baseline_group_fixations(gazes, max_gap_ms)]
+
+
+def assert_same_fixations(actual, wanted):
+    assert len(actual) == len(wanted)
+    for a, w in zip(actual, wanted):
+        assert a.keys() == w.keys()
+        for k in w:
+            if k in ("centroid_x", "centroid_y"):
+                assert a[k] == pytest.approx(w[k])
+            else:
+                assert a[k] == w[k], k
+
+
+@pytest.mark.parametrize("max_gap_ms", THRESHOLDS)
+def test_accumulators_match_baseline(max_gap_ms):
+    for gazes in (parse_eye_tracking(XML_PATH), synthetic_gazes()):
+        actual = [finalize_fixation(f) for f in group_fixations(gazes, max_gap_ms=max_gap_ms)]
+        assert_same_fixations(actual, baseline(gazes, max_gap_ms))
+
+
+def test_keep_samples_matches_baseline():
+    gazes = synthetic_gazes()
+    kept = group_fixations(gazes, keep_samples=True)
+    assert [f["samples"] for f in kept] == [f["samples"] for f in baseline_group_fixations(gazes)]
+
+
+@pytest.mark.parametrize("max_gap_ms", [75, 1000])
+def test_streaming_matches_parsed(max_gap_ms):
+    assert_same_fixations(
+        compute_fixations(XML_PATH, max_gap_ms=max_gap_ms),
+        baseline(parse_eye_tracking(XML_PATH), max_gap_ms),
+    )
+
+
+def test_stream_is_time_ordered():
+    times = [g["t"] for g in iter_eye_tracking(XML_PATH)]
+    assert times == sorted(times)
+    assert len(times) == len(parse_eye_tracking(XML_PATH))
+
+
+def test_out_of_order_falls_back_to_sorting():
+    gazes = synthetic_gazes(200)
+    shuffled = gazes[100:] + gazes[:100]
+    groups = consume_in_time_order(lambda: iter(shuffled), group_fixations)
+    assert_same_fixations([finalize_fixation(f) for f in groups], baseline(gazes, 75))
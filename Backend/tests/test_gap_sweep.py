@@ -0,0 +1,45 @@
+import pytest
+
+from fixation_finder import parse_eye_tracking, group_fixations, finalize_fixation
+from gap_sweep import build_gap_structure, count_fixations, total_dwell_ms, fixation_durations, \
+    sweep_max_gap
+
+from conftest import XML_PATH, THRESHOLDS, synthetic_gazes
+
+
+def expected(gazes, max_gap_ms):
+    return [finalize_fixation(f) for f in group_fixations(gazes, max_gap_ms=max_gap_ms)]
+
+
+@pytest.fixture(scope="module", params=["sample", "synthetic"])
+def gazes(request):
+    if request.param == "sample":
+        return parse_eye_tracking(XML_PATH)
+    return synthetic_gazes()
+
+
+@pytest.mark.parametrize("max_gap_ms", THRESHOLDS)
+def test_sweep_matches_group_fixations(gazes, max_gap_ms):
+    structure = build_gap_structure(gazes)
+    fixations = expected(gazes, max_gap_ms)
+    durations = [f["duration_ms"] for f in fixations]
+
+    assert count_fixations(structure, max_gap_ms) == len(fixations)
+    assert fixation_durations(structure, max_gap_ms) == durations
+    assert total_dwell_ms(structure, max_gap_ms) == sum(durations)
+
+
+def test_sweep_max_gap_summary(gazes):
+    structure = build_gap_structure(gazes)
+    for row in sweep_max_gap(structure, THRESHOLDS):
+        durations = sorted(f["duration_ms"] for f in expected(gazes, row["max_gap_ms"]))
+        assert row["num_fixations"] == len(durations)
+        assert row["total_dwell_ms"] == sum(durations)
+        assert row["max_duration_ms"] == (durations[-1] if durations else 0)
+
+
+def test_empty_recording():
+    structure = build_gap_structure([])
+    assert count_fixations(structure, 75) == 0
+    assert fixation_durations(structure, 75) == []
+    assert sweep_max_gap(structure, [75])[0]["num_fixations"] == 0
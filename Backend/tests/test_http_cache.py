@@ -0,0 +1,94 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import http_cache
+from http_cache import make_etag, etag_matches, choose_encoding, json_response
+
+
+class FakeRequest:
+    def __init__(self, **headers):
+        self.headers = {k.replace("_", "-"): v for k, v in headers.items()}
+
+
+@pytest.fixture
+def etag(tmp_path):
+    path = tmp_path / "a.xml"
+    path.write_text("<gazes/>")
+    return make_etag([str(path)], {"max_gap_ms": 75})
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("*", True),
+    ("{etag}", True),
+    ("W/{etag}", True),
+    ("w/{etag}", True),
+    ('"other", W/{etag}', True),
+    ("{gzip}", True),
+    ("W/{gzip}", True),
+    ('"other"', False),
+    ('W/"other"', False),
+])
+def test_etag_matches(etag, header, matches):
+    if header is not None:
+        header = header.format(etag=etag, gzip=etag[:-1] + '-gzip"')
+    assert etag_matches(FakeRequest(if_none_match=header), etag) is matches
+
+
+def test_etag_changes_with_inputs_and_version(tmp_path, monkeypatch):
+    path = tmp_path / "a.xml"
+    path.write_text("<gazes/>")
+    first = make_etag([str(path)], {"max_gap_ms": 75})
+    assert make_etag([str(path)], {"max_gap_ms": 75}) == first
+    assert make_etag([str(path)], {"max_gap_ms": 76}) != first
+    monkeypatch.setattr(http_cache, "PAYLOAD_VERSION", http_cache.PAYLOAD_VERSION + 1)
+    assert make_etag([str(path)], {"max_gap_ms": 75}) != first
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0.0", None),
+    ("gzip;q=0.00", None),
+    ("gzip; q=0", None),
+    ("gzip;q=0.001", "gzip"),
+    ("gzip;q=abc", None),
+    ("*", "gzip"),
+    ("*;q=0", None),
+    ("*, gzip;q=0", None),
+])
+def test_choose_encoding_gzip(monkeypatch, header, expected):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    assert choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("br, gzip", "br"),
+    ("gzip, br;q=0.5", "gzip"),
+    ("gzip;q=0.5, br;q=0.00", "gzip"),
+    ("*", "br"),
+])
+def test_choose_encoding_prefers_quality_then_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(http_cache, "brotli", object())
+    assert choose_encoding(header) == expected
+
+
+def test_json_response_compresses_large_bodies(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    payload = {"fixations": list(range(1000))}
+    response = json_response(FakeRequest(accept_encoding="gzip"), payload, '"abc"')
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"abc-gzip"'
+    assert json.loads(gzip.decompress(response.body)) == payload
+
+    small = json_response(FakeRequest(accept_encoding="gzip"), {"a": 1}, '"abc"')
+    assert "content-encoding" not in small.headers
+    assert small.headers["etag"] == '"abc"'
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("tree_sitter_languages")
+
+import precompute
+from precompute import PrecomputeQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def wait_idle(queue, timeout_s=5):
+    deadline = time.time() + timeout_s
+    while any(j["status"] in ("queued", "running") for j in queue.jobs()):
+        assert time.time() < deadline, "precompute jobs did not finish"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(4):
+        xml = tmp_path / f"{i}_eye_tracking.xml"
+        code = tmp_path / f"code{i}.py"
+        xml.write_text("<itrace_core><gazes/></itrace_core>")
+        code.write_text(f"x = {i}\n")
+        paths.append((str(xml), str(code)))
+    return paths
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = PrecomputeQueue(str(tmp_path), max_workers=1)
+    yield q
+    q.shutdown()
+
+
+def test_failures_back_off_then_give_up(queue, files, monkeypatch):
+    calls = []
+    clock = Clock()
+    monkeypatch.setattr(precompute, "time", clock)
+
+    def fail(xml_path, code_path, language, max_gap_ms=75, on_stage=None):
+        calls.append(xml_path)
+        raise ValueError("broken recording")
+
+    monkeypatch.setattr(precompute, "analyze_session", fail)
+    xml, code = files[0]
+    assert queue.register_target(xml, code, "python") is not None
+    wait_idle(queue)
+    assert queue.jobs()[0]["status"] == "failed"
+    assert queue.jobs()[0]["error"] == "broken recording"
+
+    # within the backoff window nothing is queued again
+    assert queue.register_target(xml, code, "python") is None
+    assert queue.scan() == []
+    assert len(calls) == 1
+
+    # the window doubles with every attempt, and after MAX_ATTEMPTS the key is given up
+    clock.now += precompute.RETRY_BASE_S
+    assert queue.register_target(xml, code, "python") is not None
+    wait_idle(queue)
+    clock.now += precompute.RETRY_BASE_S
+    assert queue.register_target(xml, code, "python") is None
+    clock.now += precompute.RETRY_BASE_S
+    assert queue.register_target(xml, code, "python") is not None
+    wait_idle(queue)
+    assert len(calls) == precompute.MAX_ATTEMPTS == 3
+    clock.now += 10 ** 6
+    assert queue.register_target(xml, code, "python") is None
+
+
+def test_results_are_evicted_least_recently_used(queue, files, monkeypatch):
+    monkeypatch.setattr(precompute, "MAX_RESULTS", 2)
+    for i, (xml, code) in enumerate(files[:2]):
+        queue.store_result(xml, code, "python", 75, {"n": i})
+    assert queue.get_result(*files[0], "python", 75) == {"n": 0}  # now most recent
+
+    queue.store_result(*files[2], "python", 75, {"n": 2})
+    assert queue.get_result(*files[1], "python", 75) is None
+    assert queue.get_result(*files[0], "python", 75) == {"n": 0}
+    assert queue.get_result(*files[2], "python", 75) == {"n": 2}
+    assert queue.get_result(*files[2], "python", 50) is None  # other max_gap_ms is not cached
+
+
+def test_stale_result_is_replaced(queue, files):
+    xml, code = files[0]
+    queue.store_result(xml, code, "python", 75, {"v": 1})
+    with open(code, "a") as f:
+        f.write("y = 2\n")
+    assert queue.get_result(xml, code, "python", 75) is None
+    queue.store_result(xml, code, "python", 75, {"v": 2})
+    assert len(queue._results) == 1
+
+
+def test_finished_jobs_are_pruned(queue, files, tmp_path, monkeypatch):
+    monkeypatch.setattr(precompute, "MAX_JOBS", 2)
+    monkeypatch.setattr(precompute, "analyze_session",
+                        lambda xml_path, code_path, language, max_gap_ms=75, on_stage=None: {})
+    for xml, code in files:
+        queue.register_target(xml, code, "python")
+        wait_idle(queue)
+    jobs = queue.jobs()
+    assert len(jobs) == 2
+    assert [j["xml_path"] for j in jobs] == [str(tmp_path / f"{i}_eye_tracking.xml") for i in (2, 3)]
+    assert all(j["status"] == "done" for j in jobs)
+
+
+def test_relative_and_absolute_paths_share_a_result(files, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    seen = []
+    monkeypatch.setattr(precompute, "compute_fixations",
+                        lambda xml_path, max_gap_ms, code_path=None, tokens=None: seen.append(code_path) or [])
+    rel = precompute.analyze_session("0_eye_tracking.xml", "code0.py", "python")
+    abs_ = precompute.analyze_session(*files[0], "python")
+    assert rel["file"] == abs_["file"]
+    assert rel["tokens"] == abs_["tokens"]
+    assert seen == [files[0][1], files[0][1]]
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+pytest.importorskip("tree_sitter_languages")
+
+from fixation_finder import make_file_id
+from session_store import init_store, connect_store, ingest_session, ingest_files, list_sessions, \
+    top_tokens, sessions_for_token, tokens_in_lines
+
+from conftest import XML_PATH
+
+
+def token(line, start, end, text="x"):
+    return {
+        "token_id": f"ignored:{line}:{start}-{line}:{end}",
+        "type": "identifier",
+        "text": text,
+        "start": {"line": line, "column": start},
+        "end": {"line": line, "column": end},
+    }
+
+
+def fixation(index, token_id, start_time, duration_ms):
+    return {
+        "index": index, "token_id": token_id,
+        "start_time": start_time, "end_time": start_time + duration_ms,
+        "duration_ms": duration_ms, "centroid_x": 0.5, "centroid_y": 0.5,
+        "num_samples": 3, "value": "x",
+    }
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "foo.py").write_text("x = 1\n")
+    db = str(tmp_path / "store.sqlite3")
+    init_store(db)
+    conn = connect_store(db)
+    yield conn
+    conn.close()
+
+
+def test_path_spellings_share_a_file(store, tmp_path):
+    tokens = [token(1, 1, 2), token(1, 5, 6, "1")]
+    # the span joins the sessions even though the recordings' id prefixes differ
+    ingest_session(store, "s1", "a.xml", "foo.py", "python",
+                   [fixation(1, "aaa:1:1-1:2", 0, 100)], tokens)
+    ingest_session(store, "s2", "b.xml", str(tmp_path / "foo.py"), "python",
+                   [fixation(1, "bbb:1:1-1:2", 0, 40), fixation(2, "bbb:1:5-1:6", 60, 10)], tokens)
+
+    file_ids = {s["file_id"] for s in list_sessions(store)}
+    assert file_ids == {make_file_id(str(tmp_path / "foo.py"))}
+    file_id = file_ids.pop()
+
+    top = top_tokens(store, file_id)
+    assert [(t["start_col"], t["num_sessions"], t["total_dwell_ms"]) for t in top] == \
+        [(1, 2, 140), (5, 1, 10)]
+    assert [s["session_id"] for s in sessions_for_token(store, file_id, "any:1:1-1:2")] == ["s1", "s2"]
+    assert [t["total_dwell_ms"] for t in tokens_in_lines(store, file_id, 1, 1)] == [140, 10]
+
+
+def test_ingest_files_canonicalizes_code_path(store, tmp_path):
+    ingest_files(store, XML_PATH, "foo.py", "python", session_id="rel")
+    ingest_files(store, XML_PATH, str(tmp_path / "foo.py"), "python", session_id="abs")
+    sessions = list_sessions(store)
+    assert len({(s["file_id"], s["code_path"]) for s in sessions}) == 1
+
+
+def test_reingest_replaces_rows(store):
+    tokens = [token(1, 1, 2)]
+    ingest_session(store, "s1", "a.xml", "foo.py", "python", [fixation(1, "a:1:1-1:2", 0, 5)], tokens)
+    ingest_session(store, "s1", "a.xml", "foo.py", "python", [fixation(1, "a:1:1-1:2", 0, 7)], tokens)
+    assert len(list_sessions(store)) == 1
+    assert store.execute("SELECT SUM(total_dwell_ms) FROM token_stats").fetchone()[0] == 7
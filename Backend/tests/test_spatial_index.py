@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+from spatial_index import build_line_index, lookup_token, build_token_order, token_position, \
+    build_screen_segments, find_segment, segment_position
+
+
+def tok(name, start, end):
+    return {"text": name, "start": {"line": start[0], "column": start[1]},
+            "end": {"line": end[0], "column": end[1]}}
+
+
+# line 1: "def foo(a):"   line 2-3: a string spanning two lines, then "x"
+TOKENS = [
+    tok("def", (1, 1), (1, 4)), tok("foo", (1, 5), (1, 8)), tok("(", (1, 8), (1, 9)),
+    tok("a", (1, 9), (1, 10)), tok(")", (1, 10), (1, 11)), tok(":", (1, 11), (1, 12)),
+    tok("'''s", (2, 5), (3, 4)), tok("x", (3, 6), (3, 7)),
+]
+
+
+def text(token):
+    return token["text"] if token else None
+
+
+@pytest.mark.parametrize("line, column, tolerance, expected", [
+    (1, 1, 0, "def"),
+    (1, 3, 0, "def"),
+    (1, 8, 0, "("),      # end columns are exclusive
+    (1, 4, 0, None),     # the space between def and foo
+    (1, 4, 1, "def"),    # tie goes to the token on the left
+    (1, 13, 1, None),
+    (1, 13, 2, ":"),
+    (2, 80, 0, "'''s"),  # middle piece of a multi-line token runs to the end of the line
+    (3, 1, 0, "'''s"),
+    (3, 5, 1, "x"),
+    (3, 5, 0, None),
+    (4, 1, 5, None),     # no tokens on the line
+])
+def test_lookup_token(line, column, tolerance, expected):
+    index = build_line_index(TOKENS)
+    assert text(lookup_token(index, line, column, tolerance)) == expected
+
+
+@pytest.mark.parametrize("span, expected", [
+    ((1, 5, 1, 8), 1),     # exact
+    ((1, 6, 1, 7), 1),     # inside foo
+    ((1, 4, 1, 12), 1),    # starts in whitespace: first token starting inside the span
+    ((1, 1, 1, 12), 0),    # a whole statement lands on its first token
+    ((2, 9, 2, 12), 6),    # inside the multi-line string
+    ((3, 4, 3, 6), None),  # whitespace only
+    ((9, 1, 9, 2), None),
+    (None, None),
+])
+def test_token_position(span, expected):
+    assert token_position(build_token_order(TOKENS), span) == expected
+
+
+def screen_points(rng, path, t0, n, line_offset, x_range=(0.2, 0.8), y_range=(0.1, 0.9)):
+    """Located gazes with line = 50 * y + offset and column = 120 * x + 1, in time order."""
+    points = []
+    for i in range(n):
+        x = rng.uniform(*x_range)
+        y = rng.uniform(*y_range)
+        points.append((t0 + 10 * i, path, x, y, round(50 * y + line_offset), round(120 * x + 1)))
+    return points
+
+
+def test_segments_split_on_scroll_and_path():
+    rng = random.Random(1)
+    points = (screen_points(rng, "/a.py", 0, 200, 1)
+              + screen_points(rng, "/a.py", 5000, 200, 21)    # scrolled down 20 lines
+              + screen_points(rng, "/b.py", 10000, 200, 1))
+    segments = build_screen_segments(points)
+
+    assert [(s["path"], s["start_time"], s["end_time"]) for s in segments] == [
+        ("/a.py", 0, 1990), ("/a.py", 5000, 6990), ("/b.py", 10000, 11990)]
+    for seg, offset in zip(segments, (1, 21, 1)):
+        assert seg["line"][0] == pytest.approx(50, rel=0.02)
+        assert seg["line"][1] == pytest.approx(offset, abs=0.5)
+        assert seg["column"][0] == pytest.approx(120, rel=0.02)
+
+
+def test_segment_without_spread_borrows_slopes():
+    rng = random.Random(2)
+    points = screen_points(rng, "/a.py", 0, 100, 1)
+    # after scrolling, the reader only moves down one column: no x spread to fit
+    points += screen_points(rng, "/a.py", 5000, 20, 31, x_range=(0.5, 0.5))
+    segments = build_screen_segments(points)
+
+    assert len(segments) == 2
+    first, second = segments
+    assert second["column"][0] == first["column"][0]
+    assert second["line"][1] == pytest.approx(31, abs=0.5)
+    assert segment_position(second, 0.5, 0.5) == (56, 61)
+
+
+def test_unfittable_segment_without_neighbours_is_dropped():
+    points = [(i, "/a.py", 0.5, 0.5, 10, 20) for i in range(5)]
+    assert build_screen_segments(points) == []
+    assert build_screen_segments([]) == []
+
+
+def test_find_segment():
+    rng = random.Random(3)
+    segments = build_screen_segments(screen_points(rng, "/a.py", 0, 50, 1)
+                                     + screen_points(rng, "/a.py", 5000, 50, 21))
+    starts = [s["start_time"] for s in segments]
+    assert find_segment(segments, starts, 100) is segments[0]
+    assert find_segment(segments, starts, 490 + 500) is segments[0]
+    assert find_segment(segments, starts, 490 + 501) is None
+    assert find_segment(segments, starts, 4600) is segments[1]
+    assert find_segment(segments, starts, -600) is None
+    assert find_segment(segments, starts, 10 ** 9) is None
+
+
+def test_segment_position_rejects_points_off_the_calibrated_area():
+    rng = random.Random(4)
+    seg = build_screen_segments(screen_points(rng, "/a.py", 0, 300, 1))[0]
+    assert segment_position(seg, 0.5, 0.5) == (26, 61)
+    assert segment_position(seg, 0.05, 0.5) is None      # e.g. the project tree pane
+    assert segment_position(seg, 0.5, 0.99) is None      # below the lines seen in the segment
+    assert segment_position(seg, seg["max_x"] + 0.04, 0.5) is not None
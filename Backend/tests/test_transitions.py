@@ -0,0 +1,93 @@
+from transitions import build_transition_matrix, merge_transition_matrices, top_transitions, \
+    node_degrees, enclosing_node_key
+
+
+def fix(token_id, duration_ms=10):
+    return {"token_id": token_id, "duration_ms": duration_ms}
+
+
+def edges(matrix):
+    labels = matrix["labels"]
+    return {(labels[i], labels[j]): n for (i, j), n in matrix["counts"].items()}
+
+
+def test_consecutive_fixations_are_one_visit():
+    matrix = build_transition_matrix([
+        fix("a", 10), fix("a", 20), fix("b", 5), fix("b", 5), fix("b", 5), fix("a", 1),
+    ])
+    assert edges(matrix) == {("a", "b"): 1, ("b", "a"): 1}
+    a, b = matrix["index"]["a"], matrix["index"]["b"]
+    # dwell on an edge is the whole visit to `from`
+    assert matrix["dwell"][(a, b)] == 30
+    assert matrix["dwell"][(b, a)] == 15
+    assert matrix["node_dwell"] == {a: 31, b: 15}
+
+
+def test_unkeyed_fixations_do_not_break_the_chain():
+    matrix = build_transition_matrix([fix("a"), fix(None), fix("a"), fix(None), fix("b")])
+    assert edges(matrix) == {("a", "b"): 1}
+    assert matrix["dwell"][(0, 1)] == 20
+
+
+def test_merge_remaps_labels():
+    m1 = build_transition_matrix([fix("a"), fix("b"), fix("c")])
+    m2 = build_transition_matrix([fix("c"), fix("b"), fix("c"), fix("b")])
+    merged = merge_transition_matrices([m1, m2])
+
+    assert merged["num_sessions"] == 2
+    assert sorted(merged["labels"]) == ["a", "b", "c"]
+    assert edges(merged) == {("a", "b"): 1, ("b", "c"): 2, ("c", "b"): 2}
+    assert merged["node_dwell"][merged["index"]["b"]] == 30
+
+
+def test_top_transitions_and_degrees():
+    matrix = build_transition_matrix([
+        fix("a", 1), fix("b", 1), fix("a", 1), fix("b", 5), fix("c", 1), fix("a", 1),
+    ])
+    top = top_transitions(matrix, k=2)
+    assert [(t["from"], t["to"], t["count"]) for t in top] == [("a", "b", 2), ("b", "c", 1)]
+    assert top[1]["dwell_ms"] == 5  # beats b -> a on dwell
+
+    degrees = node_degrees(matrix)
+    assert degrees["a"] == {"in_degree": 2, "out_degree": 1, "in_count": 2, "out_count": 2,
+                            "dwell_ms": 3}
+    assert degrees["b"]["out_degree"] == 2
+    assert degrees["b"]["out_count"] == 2
+
+
+def test_empty():
+    matrix = build_transition_matrix([])
+    assert top_transitions(matrix) == []
+    assert node_degrees(matrix) == {}
+
+
+def token(line, start, end):
+    return {"start": {"line": line, "column": start}, "end": {"line": line, "column": end}}
+
+
+def node(type_, start, end, first_token, end_token):
+    return {"type": type_, "start": {"line": start[0], "column": start[1]},
+            "end": {"line": end[0], "column": end[1]},
+            "first_token": first_token, "end_token": end_token}
+
+
+def test_group_by_enclosing_node():
+    # def f(x): return x   def g(y): return y   -- two functions on lines 1 and 2
+    tokens = [token(1, 1, 4), token(1, 5, 6), token(2, 1, 4), token(2, 5, 6)]
+    nodes = [node("module", (1, 1), (2, 6), 0, 4),
+             node("function_definition", (1, 1), (1, 6), 0, 2),
+             node("function_definition", (2, 1), (2, 6), 2, 4)]
+    key = enclosing_node_key(tokens, nodes, "f1")
+    fixations = [fix("f1:1:1-1:4"), fix("f1:1:5-1:6"), fix("f1:2:5-2:6"), fix("f1:9:1-9:2")]
+
+    assert [key(f) for f in fixations] == [
+        "f1:function_definition:1:1-1:6", "f1:function_definition:1:1-1:6",
+        "f1:function_definition:2:1-2:6", None,
+    ]
+    matrix = build_transition_matrix(fixations, key=key)
+    assert edges(matrix) == {
+        ("f1:function_definition:1:1-1:6", "f1:function_definition:2:1-2:6"): 1,
+    }
+
+    only_module = enclosing_node_key(tokens, nodes, "f1", node_types=["module"])
+    assert {only_module(f) for f in fixations[:3]} == {"f1:module:1:1-2:6"}
@@ -10,35 +10,67 @@ def extract_code_string(file_path: str):
         return f.read()
 
 def extract_tokens(code: str, language_name: str, file_path: str):
-    language = get_language(language_name)
-    parser = get_parser(language_name)
+    return extract_ast_nodes(code, language_name, file_path)[0]
+
+
+def _leaf_token(node: Node, code: str):
+    text = code[node.start_byte : node.end_byte]
+    if not text.strip():  # skip whitespace
+        return None
+    return {
+        "type": node.type,
+        "text": text,
+        "start": {
+            "line": node.start_point[0] + 1,
+            "column": node.start_point[1] + 1,
+        },
+        "end": {
+            "line": node.end_point[0] + 1,
+            "column": node.end_point[1] + 1,
+        },
+    }
 
+
+def extract_ast_nodes(code: str, language_name: str, file_path: str):
+    """
+    Leaf tokens (whitespace skipped) and every named AST node with the range
+    of leaf tokens it covers: tokens[first_token:end_token].
+    Nodes are in preorder, so a parent always comes before its children.
+    """
+    parser = get_parser(language_name)
     tree = parser.parse(code.encode("utf8"))
-    root = tree.root_node
 
     file_id = make_file_id(file_path)
 
     tokens = []
-    _walk(root, code, tokens)
+    nodes = []
+    _walk_nodes(tree.root_node, code, tokens, nodes)
 
-    # Add token_id AFTER walk
     for t in tokens:
         t["token_id"] = make_token_id(file_id, t)
 
+    return tokens, nodes
 
-    return tokens
 
+def _walk_nodes(root: Node, code: str, tokens: list, nodes: list):
+    # explicit stack instead of recursion, so deeply nested files do not hit
+    # the recursion limit; a (None, i) entry closes node i
+    stack = [(root, None, 0)]
+    while stack:
+        node, parent, depth = stack.pop()
+        if node is None:
+            nodes[parent]["end_token"] = len(tokens)
+            continue
+        if node.child_count == 0:
+            token = _leaf_token(node, code)
+            if token is not None:
+                tokens.append(token)
+            continue
 
-def _walk(node: Node, code: str, tokens: list):
-    """
-    Collect *leaf* nodes (actual tokens).
-    """
-    if node.child_count == 0:
-        text = code[node.start_byte : node.end_byte]
-        if text.strip():  # skip whitespace
-            tokens.append({
+        if node.is_named:
+            i = len(nodes)
+            nodes.append({
                 "type": node.type,
-                "text": text,
                 "start": {
                     "line": node.start_point[0] + 1,
                     "column": node.start_point[1] + 1,
@@ -47,11 +79,16 @@ def _walk(node: Node, code: str, tokens: list):
                     "line": node.end_point[0] + 1,
                     "column": node.end_point[1] + 1,
                 },
+                "parent": parent,
+                "depth": depth,
+                "first_token": len(tokens),
             })
-        return
+            stack.append((None, i, None))
+            parent = i
+            depth += 1
 
-    for child in node.children:
-        _walk(child, code, tokens)
+        for child in reversed(node.children):
+            stack.append((child, parent, depth))
 
 def make_token_id(file_id, token):
     span = f"{token['start']['line']}:{token['start']['column']}-" \
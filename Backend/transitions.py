@@ -0,0 +1,183 @@
+"""
+Transition Matrix Definition:
+matrix: {
+    "labels": List[str],              # node key per row/column (token_id by default)
+    "index": Dict[str, int],          # label -> row/column number
+    "counts": Dict[(int, int), int],  # (from, to) -> number of transitions
+    "dwell": Dict[(int, int), int],   # (from, to) -> ms of the visits to `from` that ended in the jump
+    "node_dwell": Dict[int, int],     # node -> total fixation time in ms
+    "num_sessions": int,
+}
+
+A visit is a run of consecutive fixations with the same key; its durations
+are summed and it counts as one node in the chain, so there are no self-loop
+edges. Only observed transitions are stored, so memory grows with the number
+of distinct jumps in the recording and not with (number of tokens) ** 2.
+"""
+import heapq
+
+from spatial_index import build_token_order, token_position
+from fixation_finder import parse_token_span
+
+
+def token_key(fixation):
+    return fixation.get("token_id")
+
+
+def enclosing_node_key(tokens, nodes, file_id, node_types=None):
+    """
+    Key that maps a fixation to the innermost AST node around its token, as
+    "<file_id>:<type>:<span>". With `node_types` (e.g. ["function_definition"])
+    only nodes of those types count; fixations outside any are skipped.
+    `tokens`/`nodes` come from extract_ast_nodes.
+    """
+    labels = [None] * len(tokens)
+    for n in nodes:  # preorder, so inner nodes overwrite outer ones
+        if node_types is not None and n["type"] not in node_types:
+            continue
+        label = f"{file_id}:{n['type']}:{n['start']['line']}:{n['start']['column']}-" \
+                f"{n['end']['line']}:{n['end']['column']}"
+        for i in range(n["first_token"], n["end_token"]):
+            labels[i] = label
+
+    order = build_token_order(tokens)
+
+    def key(fixation):
+        i = token_position(order, parse_token_span(fixation.get("token_id")))
+        return labels[i] if i is not None else None
+
+    return key
+
+
+def empty_transition_matrix():
+    return {
+        "labels": [],
+        "index": {},
+        "counts": {},
+        "dwell": {},
+        "node_dwell": {},
+        "num_sessions": 0,
+    }
+
+
+def _node(matrix, label):
+    i = matrix["index"].get(label)
+    if i is None:
+        i = len(matrix["labels"])
+        matrix["index"][label] = i
+        matrix["labels"].append(label)
+    return i
+
+
+def build_transition_matrix(fixations, key=token_key):
+    """
+    Aggregate consecutive fixations into a sparse from -> to matrix.
+
+    `key` maps a fixation to its graph node; pass a different callable to
+    group fixations by e.g. an enclosing AST node instead of the leaf token.
+    Consecutive fixations with the same key are one visit, so they add dwell
+    but no edge. Fixations whose key is None are skipped without breaking the
+    chain.
+    """
+    matrix = empty_transition_matrix()
+    matrix["num_sessions"] = 1
+    counts = matrix["counts"]
+    dwell = matrix["dwell"]
+    node_dwell = matrix["node_dwell"]
+
+    prev = None
+    visit_ms = 0
+    for f in fixations:
+        label = key(f)
+        if label is None:
+            continue
+        cur = _node(matrix, label)
+        duration = f.get("duration_ms", 0)
+        node_dwell[cur] = node_dwell.get(cur, 0) + duration
+
+        if cur == prev:
+            visit_ms += duration  # still the same visit
+            continue
+        if prev is not None:
+            edge = (prev, cur)
+            counts[edge] = counts.get(edge, 0) + 1
+            dwell[edge] = dwell.get(edge, 0) + visit_ms
+
+        prev = cur
+        visit_ms = duration
+
+    return matrix
+
+
+def merge_transition_matrices(matrices):
+    """Sum several matrices (e.g. one per session) into a new one."""
+    merged = empty_transition_matrix()
+    counts = merged["counts"]
+    dwell = merged["dwell"]
+    node_dwell = merged["node_dwell"]
+
+    for m in matrices:
+        # remap this matrix's row numbers onto the merged label space
+        remap = [_node(merged, label) for label in m["labels"]]
+        for (i, j), n in m["counts"].items():
+            edge = (remap[i], remap[j])
+            counts[edge] = counts.get(edge, 0) + n
+            dwell[edge] = dwell.get(edge, 0) + m["dwell"].get((i, j), 0)
+        for i, ms in m["node_dwell"].items():
+            k = remap[i]
+            node_dwell[k] = node_dwell.get(k, 0) + ms
+        merged["num_sessions"] += m["num_sessions"]
+
+    return merged
+
+
+def top_transitions(matrix, k=10):
+    """Return the `k` most frequent transitions, ties broken by dwell."""
+    labels = matrix["labels"]
+    dwell = matrix["dwell"]
+    top = heapq.nlargest(
+        k,
+        matrix["counts"].items(),
+        key=lambda item: (item[1], dwell.get(item[0], 0)),
+    )
+    return [
+        {
+            "from": labels[i],
+            "to": labels[j],
+            "count": n,
+            "dwell_ms": dwell.get((i, j), 0),
+        }
+        for (i, j), n in top
+    ]
+
+
+def node_degrees(matrix):
+    """
+    Per-node in/out degree.
+
+    `in_degree`/`out_degree` count distinct neighbours, `in_count`/`out_count`
+    count transitions (i.e. weighted degree).
+    """
+    size = len(matrix["labels"])
+    in_degree = [0] * size
+    out_degree = [0] * size
+    in_count = [0] * size
+    out_count = [0] * size
+
+    for (i, j), n in matrix["counts"].items():
+        out_degree[i] += 1
+        out_count[i] += n
+        in_degree[j] += 1
+        in_count[j] += n
+
+    node_dwell = matrix["node_dwell"]
+    return {
+        label: {
+            "in_degree": in_degree[i],
+            "out_degree": out_degree[i],
+            "in_count": in_count[i],
+            "out_count": out_count[i],
+            "dwell_ms": node_dwell.get(i, 0),
+        }
+        for i, label in enumerate(matrix["labels"])
+    }